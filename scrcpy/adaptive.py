@@ -0,0 +1,216 @@
+"""
+Lower the stream quality when the client falls behind, and raise it back once it keeps up
+"""
+
+import threading
+import time
+from typing import List, NamedTuple, Optional, Sequence
+
+from adbutils import AdbError
+
+
+class QualityLevel(NamedTuple):
+    """
+    Stream quality relative to the options the controller started with
+    """
+
+    bitrate_scale: float
+    size_scale: float = 1.0
+    max_fps: float = 0  # 0 keeps the initial limit
+
+
+DEFAULT_LEVELS = (
+    QualityLevel(1.0),
+    QualityLevel(0.5),
+    QualityLevel(0.25, 0.75),
+    QualityLevel(0.125, 0.5, 30),
+    QualityLevel(0.0625, 0.5, 15),
+)
+
+
+class LagSample(NamedTuple):
+    """
+    Client lag measured over one interval
+    """
+
+    buffered: float  # seconds of video received by the system but not read yet
+    decode_load: float  # fraction of the interval spent decoding, 1 means the decoder cannot keep up
+    frame_age: float  # seconds since the last decoded frame while video keeps arriving, 0 otherwise
+
+
+class AdaptiveController:
+    def __init__(
+        self,
+        client,
+        target_latency: float = 0.1,
+        interval: float = 1.0,
+        levels: Sequence[QualityLevel] = DEFAULT_LEVELS,
+        max_decode_load: float = 0.9,
+        max_frame_age: float = 1.0,
+        down_after: int = 2,
+        up_after: int = 10,
+    ):
+        """
+        Step a client's bitrate, max size and fps down while it lags, and back up once it keeps up
+
+        Lag is the video buffered in the socket, in seconds at the measured stream rate, the
+        share of time spent decoding, by the client or its decode process, and how long video
+        has been arriving without a frame coming out of the decoder. Levels are applied with
+        client.reconfigure, which restarts the server, so steps are rare: down after down_after
+        lagging intervals, up after up_after intervals far below the target.
+
+        Args:
+            client: a Client run by start, clients fed by a DeviceFleet cannot be reconfigured
+            target_latency: seconds of buffered video to stay under
+            interval: seconds between two measures
+            levels: quality levels, from the best one, applied relative to the client's options
+            max_decode_load: decode load above which the client is lagging
+            max_frame_age: seconds without decoded frame while video arrives above which the
+                client is lagging
+            down_after: lagging intervals before stepping down
+            up_after: intervals with less than a quarter of the target before stepping up
+        """
+        assert target_latency > 0, "target_latency must be greater than 0"
+        assert interval > 0, "interval must be greater than 0"
+        assert len(levels) > 0, "levels must not be empty"
+        assert down_after > 0 and up_after > 0, "down_after and up_after must be greater than 0"
+        assert not client.fed_externally, "clients fed externally, e.g. by DeviceFleet, cannot be reconfigured"
+        self.client = client
+        self.target_latency = target_latency
+        self.interval = interval
+        self.levels: List[QualityLevel] = list(levels)
+        self.max_decode_load = max_decode_load
+        self.max_frame_age = max_frame_age
+        self.down_after = down_after
+        self.up_after = up_after
+
+        self.base_options = client.options
+        # Largest dimension at full quality, levels scale from it, not from the current resolution
+        self.base_size = max(client.resolution) if client.resolution else 0
+        self.level = 0
+        self.samples: List[LagSample] = []
+        self.alive = False
+        self.thread: Optional[threading.Thread] = None
+        self.__lagging = 0
+        self.__keeping_up = 0
+        self.__last: Optional[tuple] = None
+        self.__stop_event = threading.Event()
+
+    def start(self) -> None:
+        """
+        Measure and adapt in a daemon thread
+        """
+        assert self.alive is False
+        self.alive = True
+        self.__stop_event.clear()
+        self.thread = threading.Thread(target=self.__loop, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop adapting, the client keeps its current level
+        """
+        self.alive = False
+        self.__stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def level_options(self, level: int) -> dict:
+        """
+        Options of a level, for client.reconfigure
+
+        Args:
+            level: index in levels
+        """
+        quality = self.levels[level]
+        base = self.base_options
+        options = dict(video_bit_rate=max(1, int(base.video_bit_rate * quality.bitrate_scale)))
+        max_size = base.max_size or self.base_size
+        if max_size and quality.size_scale != 1:
+            # Encoders want sizes multiple of 8
+            options["max_size"] = max(8, int(max_size * quality.size_scale) // 8 * 8)
+        else:
+            options["max_size"] = base.max_size
+        if quality.max_fps and (not base.max_fps or quality.max_fps < base.max_fps):
+            options["max_fps"] = quality.max_fps
+        else:
+            options["max_fps"] = base.max_fps
+        return options
+
+    def measure(self) -> Optional[LagSample]:
+        """
+        Lag since the previous measure, None on the first one
+        """
+        stats = self.client.stats
+        if not self.base_size and self.client.resolution:
+            # Not connected yet when the controller was created
+            self.base_size = max(self.client.resolution)
+        now = time.monotonic()
+        current = (now, stats.bytes_received, stats.decode_time)
+        last, self.__last = self.__last, current
+        if last is None or now <= last[0]:
+            return None
+        elapsed = now - last[0]
+        rate = (current[1] - last[1]) / elapsed
+        pending = self.client.pending_bytes()
+        buffered = pending / rate if rate > 0 else (float("inf") if pending else 0.0)
+        # A static screen sends nothing, only data waiting for its frame is lag
+        frame_age = 0.0
+        if stats.last_frame_at is not None and stats.last_byte_at is not None and stats.last_byte_at > stats.last_frame_at:
+            frame_age = now - stats.last_frame_at
+        return LagSample(buffered, (current[2] - last[2]) / elapsed, frame_age)
+
+    def update(self, sample: LagSample) -> Optional[int]:
+        """
+        Take a measure into account
+
+        Args:
+            sample: lag over the last interval
+
+        Returns:
+            The new level if it changes, None otherwise
+        """
+        self.samples = self.samples[-99:] + [sample]
+        if (
+            sample.buffered > self.target_latency
+            or sample.decode_load > self.max_decode_load
+            or sample.frame_age > self.max_frame_age
+        ):
+            self.__lagging += 1
+            self.__keeping_up = 0
+        elif (
+            sample.buffered < self.target_latency / 4
+            and sample.decode_load < self.max_decode_load / 2
+            and sample.frame_age < self.max_frame_age / 2
+        ):
+            self.__keeping_up += 1
+            self.__lagging = 0
+        else:
+            self.__lagging = self.__keeping_up = 0
+
+        if self.__lagging >= self.down_after and self.level < len(self.levels) - 1:
+            self.level += 1
+        elif self.__keeping_up >= self.up_after and self.level > 0:
+            self.level -= 1
+        else:
+            return None
+        self.__lagging = self.__keeping_up = 0
+        return self.level
+
+    def __loop(self) -> None:
+        while not self.__stop_event.wait(self.interval):
+            if not self.client.alive or self.client.fed_externally:
+                continue
+            sample = self.measure()
+            if sample is None:
+                continue
+            level = self.update(sample)
+            if level is None:
+                continue
+            try:
+                self.client.reconfigure(**self.level_options(level))
+            except (AdbError, ConnectionError, OSError):
+                # Lost connections are handled by the client's stream loop
+                pass
+            # The restart emptied the buffers, measure from scratch
+            self.__last = None
@@ -0,0 +1,179 @@
+"""
+Replay a recorded stream to measure decoding throughput, without device
+
+Run it on the stream of a real device before deploying a new PyAV build or pixel format, e.g.
+python -m scrcpy.benchmark stream.h264 --repeat 100 --format yuv420p
+"""
+
+import os
+import pickle
+import time
+from argparse import ArgumentParser
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
+
+from av.codec import CodecContext
+
+from .core import Client
+from .options import DECODER_NAMES
+from .timing import sleep_until
+from .transport import ReplayTransport
+
+
+class BenchmarkResult(NamedTuple):
+    """
+    Frames decoded from a stream, and where the time went
+    """
+
+    frames: int
+    seconds: float
+    bytes: int
+    stages: Dict[str, float]  # seconds spent in each stage
+
+    @property
+    def fps(self) -> float:
+        """
+        Decoded frames per second
+        """
+        return self.frames / self.seconds if self.seconds > 0 else 0.0
+
+    def report(self) -> str:
+        """
+        Human readable summary, one line per stage
+        """
+        lines = [
+            f"{self.frames} frames in {self.seconds:.3f} s: {self.fps:.1f} frames/s, "
+            f"{self.bytes * 8 / max(self.seconds, 1e-9) / 1e6:.1f} Mbit/s"
+        ]
+        for stage, seconds in self.stages.items():
+            per_frame = seconds / self.frames * 1000 if self.frames else 0.0
+            lines.append(f"  {stage}: {seconds:.3f} s, {per_frame:.3f} ms/frame")
+        return "\n".join(lines)
+
+
+def load_stream(source: Union[str, os.PathLike], chunk_size: int = 0x10000) -> List[bytes]:
+    """
+    Load a recorded stream in memory, so that reading it is not measured
+
+    Args:
+        source: raw stream file, or a pickled list of chunks like tests/test_video_data.pkl,
+            only load trusted pickles
+        chunk_size: bytes per chunk of a raw stream, like a socket read
+    """
+    with open(source, "rb") as f:
+        if os.fspath(source).endswith(".pkl"):
+            return list(pickle.load(f))
+        return list(iter(lambda: f.read(chunk_size), b""))
+
+
+def decode_stream(
+    chunks: Iterable[bytes],
+    codec_name: str = "h264",
+    pixel_format: Optional[str] = "bgr24",
+    fps: Optional[float] = None,
+    thread_type: Optional[str] = None,
+) -> BenchmarkResult:
+    """
+    Parse, decode and convert a stream the way Client.feed does, timing each stage
+
+    Args:
+        chunks: stream data
+        codec_name: codec of the stream, enum: [h264, h265, av1]
+        pixel_format: format of the ndarray frames, None skips the conversion
+        fps: decode one frame every 1 / fps seconds like a live stream, None decodes as fast as possible
+        thread_type: PyAV codec thread type, e.g. AUTO or FRAME, None keeps the default
+
+    Returns:
+        Result with the parse, decode and convert stages
+    """
+    assert codec_name in DECODER_NAMES, "codec_name must be h264, h265 or av1"
+    codec = CodecContext.create(DECODER_NAMES[codec_name], "r")
+    if thread_type is not None:
+        codec.thread_type = thread_type
+    stages = dict(parse=0.0, decode=0.0, convert=0.0)
+    frames = size = packets = 0
+
+    def decode(packet) -> None:
+        nonlocal frames, packets
+        if fps is not None:
+            sleep_until(begin + packets / fps)
+        packets += 1
+        start = time.perf_counter()
+        decoded = codec.decode(packet)
+        stages["decode"] += time.perf_counter() - start
+        for frame in decoded:
+            if pixel_format is not None:
+                start = time.perf_counter()
+                frame.to_ndarray(format=pixel_format)
+                stages["convert"] += time.perf_counter() - start
+            frames += 1
+
+    begin = time.perf_counter()
+    for chunk in list(chunks) + [b""]:
+        size += len(chunk)
+        start = time.perf_counter()
+        # An empty chunk flushes the parser
+        parsed = codec.parse(chunk)
+        stages["parse"] += time.perf_counter() - start
+        for packet in parsed:
+            decode(packet)
+    # Frames still buffered by threaded decoding
+    decode(None)
+    return BenchmarkResult(frames, time.perf_counter() - begin, size, stages)
+
+
+def replay_client(
+    chunks: Iterable[bytes],
+    codec_name: str = "h264",
+    fps: Optional[float] = None,
+    **client_options,
+) -> BenchmarkResult:
+    """
+    Play a stream to a Client through a ReplayTransport, sockets and stream loop included
+
+    Args:
+        chunks: stream data
+        codec_name: codec of the stream, enum: [h264, h265, av1]
+        fps: send one frame every 1 / fps seconds like a live stream, None sends as fast as possible
+        client_options: other Client arguments, e.g. flip, but not decode_process: the stream
+            loop would only hand the data over, and return before the worker is done
+
+    Returns:
+        Result with the feed stage, decoding and frame listeners, and the rest of the stream loop
+    """
+    assert client_options.get("decode_process") is None, "decode_process is not supported, use decode_stream"
+    chunks = list(chunks)
+    transport = ReplayTransport(chunks, fps=fps, codec_name=codec_name)
+    client = Client(transport=transport, codec_name=codec_name, block_frame=True, **client_options)
+    begin = time.perf_counter()
+    try:
+        client.start()
+    except ConnectionError:  # End of the stream
+        pass
+    seconds = time.perf_counter() - begin
+    stats = client.stats
+    stages = dict(feed=stats.decode_time, loop=max(0.0, seconds - stats.decode_time))
+    return BenchmarkResult(stats.frames_decoded, seconds, stats.bytes_received, stages)
+
+
+def main():
+    parser = ArgumentParser(description="Measure decoding throughput on a recorded stream")
+    parser.add_argument("source", help="raw stream file, or pickled chunks (.pkl)")
+    parser.add_argument("--codec", default="h264", choices=list(DECODER_NAMES), help="codec of the stream")
+    parser.add_argument("--fps", type=float, default=None, help="replay at this frame rate instead of as fast as possible")
+    parser.add_argument("--repeat", type=int, default=1, help="play the stream this many times")
+    parser.add_argument("--format", default="bgr24", help="pixel format of the frames, none to skip the conversion")
+    parser.add_argument("--threads", default=None, help="PyAV thread type, e.g. AUTO")
+    parser.add_argument("--client", action="store_true", help="decode with a Client over a ReplayTransport")
+    args = parser.parse_args()
+
+    chunks = load_stream(args.source) * args.repeat
+    if args.client:
+        result = replay_client(chunks, args.codec, args.fps)
+    else:
+        pixel_format = None if args.format == "none" else args.format
+        result = decode_stream(chunks, args.codec, pixel_format, args.fps, args.threads)
+    print(result.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -298,6 +298,9 @@ KEYCODE_KEYCODE_THUMBS_DOWN = 287
 EVENT_INIT = "init"
 EVENT_FRAME = "frame"
 EVENT_DISCONNECT = "disconnect"
+EVENT_DEVICE_MESSAGE = "device_message"
+EVENT_RECONNECT = "reconnect"
+EVENT_STALL = "stall"
 
 # Type
 TYPE_INJECT_KEYCODE = 0
@@ -312,6 +315,31 @@ TYPE_GET_CLIPBOARD = 8
 TYPE_SET_CLIPBOARD = 9
 TYPE_SET_SCREEN_POWER_MODE = 10
 TYPE_ROTATE_DEVICE = 11
+TYPE_UHID_CREATE = 12
+TYPE_UHID_INPUT = 13
+TYPE_UHID_DESTROY = 14
+TYPE_OPEN_HARD_KEYBOARD_SETTINGS = 15
+TYPE_START_APP = 16
+TYPE_RESET_VIDEO = 17
+
+# Device message type
+DEVICE_MSG_TYPE_CLIPBOARD = 0
+DEVICE_MSG_TYPE_ACK_CLIPBOARD = 1
+DEVICE_MSG_TYPE_UHID_OUTPUT = 2
+
+# Copy key, sent by the device before reading the clipboard
+COPY_KEY_NONE = 0
+COPY_KEY_COPY = 1
+COPY_KEY_CUT = 2
+
+# Text
+INJECT_TEXT_MAX_LENGTH = 300  # UTF-8 bytes per inject text message
+START_APP_NAME_MAX_LENGTH = 255  # UTF-8 bytes
+
+# Clipboard
+SEQUENCE_INVALID = 0  # Set clipboard without acknowledgement
+CONTROL_MSG_MAX_SIZE = 1 << 18
+CLIPBOARD_TEXT_MAX_LENGTH = CONTROL_MSG_MAX_SIZE - 14  # UTF-8 bytes
 
 # Lock screen orientation
 LOCK_SCREEN_ORIENTATION_UNLOCKED = -1
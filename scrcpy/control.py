@@ -1,10 +1,21 @@
+import collections
+import contextlib
 import functools
-import socket
+import itertools
 import struct
+import threading
+import time
 from time import sleep
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
 
 import scrcpy
-from scrcpy import const
+from scrcpy import const, gesture
+from scrcpy.device_message import AckClipboardMessage, ClipboardMessage, DeviceMessage
+from scrcpy.timing import sleep_until
+
+# Default seconds to wait for the device to answer a request
+REQUEST_TIMEOUT = 5.0
 
 
 def inject(control_type: int):
@@ -19,9 +30,7 @@ def inject(control_type: int):
         @functools.wraps(f)
         def inner(*args, **kwargs):
             package = struct.pack(">B", control_type) + f(*args, **kwargs)
-            if args[0].parent.control_socket is not None:
-                with args[0].parent.control_socket_lock:
-                    args[0].parent.control_socket.send(package)
+            args[0].send(package)
             return package
 
         return inner
@@ -29,9 +38,136 @@ def inject(control_type: int):
     return wrapper
 
 
+def split_utf8(text: str, max_length: int) -> List[str]:
+    """
+    Split text into chunks whose UTF-8 encoding fits max_length bytes, never cutting a code point
+
+    Args:
+        text: text to split
+        max_length: maximum UTF-8 length of a chunk in bytes, at least 4
+    """
+    assert max_length >= 4, "max_length must be greater than or equal to 4"
+    buffer = text.encode("utf-8")
+    chunks = []
+    start = 0
+    while start < len(buffer):
+        end = start + max_length
+        if end < len(buffer):
+            # Step back over continuation bytes (0b10xxxxxx) to a code point boundary
+            while buffer[end] & 0xC0 == 0x80:
+                end -= 1
+        chunks.append(buffer[start:end].decode("utf-8"))
+        start = end
+    return chunks
+
+
 class ControlSender:
+    """
+    Every method may be called from any thread: writes are serialized by the parent's
+    control_socket_lock, batches are per thread, and answers are matched under a lock.
+    """
+
     def __init__(self, parent):
         self.parent = parent
+        # Size of the space positions are given in, None for the frames of the session
+        self.coordinate_space: Optional[Tuple[int, int]] = None
+        self.listeners: List[Callable[[bytes], None]] = []
+        self.__listeners_lock = threading.Lock()
+        self.__local = threading.local()
+        self.__pending_lock = threading.Lock()
+        self.__clipboard_requests: Deque[Future] = collections.deque()
+        self.__ack_requests: Dict[int, Future] = {}
+        self.__sequence = itertools.count(1)
+
+    def screen_size(self) -> Tuple[int, int]:
+        """
+        Size of the space positions are given in, the coordinate space or the frame size
+        """
+        return self.coordinate_space or self.parent.resolution
+
+    def __to_frame(self, x: float, y: float) -> Tuple[int, int, int, int]:
+        """
+        Map a position from the coordinate space to the frames, which the server expects
+
+        Returns:
+            x, y, frame width, frame height
+        """
+        width, height = self.parent.resolution
+        if self.coordinate_space is not None:
+            x = x * width / self.coordinate_space[0]
+            y = y * height / self.coordinate_space[1]
+        return int(max(x, 0)), int(max(y, 0)), int(width), int(height)
+
+    def add_listener(self, listener: Callable[[bytes], None]) -> None:
+        """
+        Add a listener receiving every serialized message sent to the device
+
+        Args:
+            listener: A function to receive the message bytes
+        """
+        with self.__listeners_lock:
+            # Copy on write, so sending never iterates a list being modified
+            self.listeners = self.listeners + [listener]
+
+    def remove_listener(self, listener: Callable[[bytes], None]) -> None:
+        """
+        Remove a message listener
+
+        Args:
+            listener: A function to receive the message bytes
+        """
+        with self.__listeners_lock:
+            listeners = list(self.listeners)
+            listeners.remove(listener)
+            self.listeners = listeners
+
+    def send(self, package: bytes) -> None:
+        """
+        Send a serialized control message, or queue it if a batch is open in this thread
+
+        Args:
+            package: serialized control message
+        """
+        for listener in self.listeners:
+            listener(package)
+
+        batch: Optional[List[bytes]] = getattr(self.__local, "batch", None)
+        if batch is not None:
+            batch.append(package)
+        else:
+            self.__write(package)
+
+    def __write(self, data: bytes) -> None:
+        """
+        Write to the control socket, data sent without open control socket is dropped
+
+        The socket is read once under the lock, the client may replace or drop it meanwhile.
+        """
+        with self.parent.control_socket_lock:
+            sock = self.parent.control_socket
+            if sock is None or getattr(sock, "fileno", lambda: 0)() == -1:
+                return
+            sock.sendall(data)
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[List[bytes]]:
+        """
+        Collect every message sent in this thread inside the block, and write them in one call on exit
+
+        Nested batches are merged into the outermost one.
+        """
+        if getattr(self.__local, "batch", None) is not None:
+            yield self.__local.batch
+            return
+
+        self.__local.batch = []
+        try:
+            yield self.__local.batch
+            buffer = b"".join(self.__local.batch)
+        finally:
+            self.__local.batch = None
+        if buffer:
+            self.__write(buffer)
 
     @inject(const.TYPE_INJECT_KEYCODE)
     def keycode(self, keycode: int, action: int = const.ACTION_DOWN, repeat: int = 0) -> bytes:
@@ -48,7 +184,7 @@ class ControlSender:
     @inject(const.TYPE_INJECT_TEXT)
     def text(self, text: str) -> bytes:
         """
-        Send text to device
+        Send text to device, the server rejects texts longer than INJECT_TEXT_MAX_LENGTH bytes, see type_text
 
         Args:
             text: text to send
@@ -57,6 +193,31 @@ class ControlSender:
         buffer = text.encode("utf-8")
         return struct.pack(">i", len(buffer)) + buffer
 
+    def type_text(self, text: str, paste_threshold: Optional[int] = 1024, timeout: Optional[float] = REQUEST_TIMEOUT) -> None:
+        """
+        Send text of any length to device
+
+        Short texts are split into INJECT_TEXT_MAX_LENGTH messages on code point boundaries and
+        written in one call. Texts longer than paste_threshold bytes are pasted through the
+        clipboard instead, which is much faster on the device side than injecting key events.
+
+        Args:
+            text: text to send
+            paste_threshold: UTF-8 length in bytes above which the clipboard is used, None never pastes
+            timeout: seconds to wait for each clipboard acknowledgement, None waits forever
+
+        Raises:
+            ConnectionError: pasting without control socket
+            TimeoutError: a clipboard acknowledgement did not come within timeout
+        """
+        if paste_threshold is not None and len(text.encode("utf-8")) > paste_threshold:
+            self.paste_text(text, timeout)
+            return
+
+        with self.batch():
+            for chunk in split_utf8(text, const.INJECT_TEXT_MAX_LENGTH):
+                self.text(chunk)
+
     @inject(const.TYPE_INJECT_TOUCH_EVENT)
     def touch(
         self,
@@ -74,15 +235,11 @@ class ControlSender:
             action: ACTION_DOWN | ACTION_UP | ACTION_MOVE
             touch_id: Default using virtual id -1, you can specify it to emulate multi finger touch
         """
-        x, y = max(x, 0), max(y, 0)
         return struct.pack(
             ">BqiiHHHii",
             action,
             touch_id,
-            int(x),
-            int(y),
-            int(self.parent.resolution[0]),
-            int(self.parent.resolution[1]),
+            *self.__to_frame(x, y),
             0xFFFF,
             1,
             1,
@@ -99,14 +256,9 @@ class ControlSender:
             h: horizontal movement
             v: vertical movement
         """
-
-        x, y = max(x, 0), max(y, 0)
         return struct.pack(
             ">iiHHii",
-            int(x),
-            int(y),
-            int(self.parent.resolution[0]),
-            int(self.parent.resolution[1]),
+            *self.__to_frame(x, y),
             int(h),
             int(v),
         )
@@ -142,43 +294,142 @@ class ControlSender:
         """
         return b""
 
-    def get_clipboard(self) -> str:
+    def request_clipboard(self, copy_key: int = const.COPY_KEY_NONE) -> "Future[str]":
+        """
+        Ask the device for its clipboard without waiting for the answer
+
+        The answer is read by the client's device message reader, see handle_device_message.
+        Clipboard messages carry no request id, they answer the oldest pending request: the client
+        disables clipboard autosync, with it a device copy made while a request is pending would
+        be taken as the answer.
+
+        Args:
+            copy_key: COPY_KEY_NONE | COPY_KEY_COPY | COPY_KEY_CUT, key injected before reading
+
+        Returns:
+            A future resolved with the clipboard text
+
+        Raises:
+            ConnectionError: there is no control socket, the request could not be sent
+        """
+        if self.parent.control_socket is None:
+            raise ConnectionError("Control socket is not connected")
+        future: Future = Future()
+        with self.__pending_lock:
+            # Answers come back in request order, so enqueue and send atomically
+            self.__clipboard_requests.append(future)
+            self.send(struct.pack(">BB", const.TYPE_GET_CLIPBOARD, copy_key))
+        return future
+
+    def get_clipboard(self, copy_key: int = const.COPY_KEY_NONE, timeout: Optional[float] = REQUEST_TIMEOUT) -> str:
         """
         Get clipboard
+
+        Args:
+            copy_key: COPY_KEY_NONE | COPY_KEY_COPY | COPY_KEY_CUT, key injected before reading
+            timeout: seconds to wait for the answer, None waits forever
+
+        Raises:
+            ConnectionError: there is no control socket
+            TimeoutError: no answer within timeout
         """
-        # Since this function need socket response, we can't auto inject it any more
-        s: socket.socket = self.parent.control_socket
+        return self.request_clipboard(copy_key).result(timeout)
 
-        with self.parent.control_socket_lock:
-            # Flush socket
-            s.setblocking(False)
-            while True:
-                try:
-                    s.recv(1024)
-                except BlockingIOError:
-                    break
-            s.setblocking(True)
-
-            # Read package
-            package = struct.pack(">B", const.TYPE_GET_CLIPBOARD)
-            s.send(package)
-            (code,) = struct.unpack(">B", s.recv(1))
-            assert code == 0
-            (length,) = struct.unpack(">i", s.recv(4))
-
-            return s.recv(length).decode("utf-8")
+    def handle_device_message(self, message: DeviceMessage) -> None:
+        """
+        Resolve the pending request matching a message received from the device
+
+        Args:
+            message: parsed device message
+        """
+        if isinstance(message, ClipboardMessage):
+            # Without a pending request, e.g. with clipboard autosync, the message is not an answer
+            with self.__pending_lock:
+                future = self.__clipboard_requests.popleft() if self.__clipboard_requests else None
+            if future is not None and not future.done():
+                future.set_result(message.text)
+        elif isinstance(message, AckClipboardMessage):
+            with self.__pending_lock:
+                future = self.__ack_requests.pop(message.sequence, None)
+            if future is not None and not future.done():
+                future.set_result(message.sequence)
+
+    def cancel_pending(self, exception: Exception) -> None:
+        """
+        Fail every request still waiting for a device message, e.g. once the socket is closed
+
+        Args:
+            exception: exception set on the pending futures
+        """
+        with self.__pending_lock:
+            pending = list(self.__clipboard_requests) + list(self.__ack_requests.values())
+            self.__clipboard_requests.clear()
+            self.__ack_requests.clear()
+        for future in pending:
+            future.set_exception(exception)
 
     @inject(const.TYPE_SET_CLIPBOARD)
-    def set_clipboard(self, text: str, paste: bool = False) -> bytes:
+    def set_clipboard(self, text: str, paste: bool = False, sequence: int = const.SEQUENCE_INVALID) -> bytes:
         """
         Set clipboard
 
         Args:
-            text: the string you want to set
+            text: the string you want to set, at most CLIPBOARD_TEXT_MAX_LENGTH bytes in UTF-8
             paste: paste now
+            sequence: if not SEQUENCE_INVALID, the device acknowledges with this number once applied
         """
         buffer = text.encode("utf-8")
-        return struct.pack(">?i", paste, len(buffer)) + buffer
+        assert len(buffer) <= const.CLIPBOARD_TEXT_MAX_LENGTH, "text exceeds CLIPBOARD_TEXT_MAX_LENGTH"
+        return struct.pack(">Q?I", sequence, paste, len(buffer)) + buffer
+
+    def set_clipboard_async(self, text: str, paste: bool = False) -> "Future[int]":
+        """
+        Set clipboard with a new sequence number
+
+        Wrap the result with asyncio.wrap_future to await it from a coroutine.
+
+        Args:
+            text: the string you want to set, at most CLIPBOARD_TEXT_MAX_LENGTH bytes in UTF-8
+            paste: paste now
+
+        Returns:
+            A future resolved with the sequence number once the device has applied the clipboard
+            (and pasted it, if paste is set)
+
+        Raises:
+            ConnectionError: there is no control socket, the clipboard could not be sent
+        """
+        if self.parent.control_socket is None:
+            raise ConnectionError("Control socket is not connected")
+        future: Future = Future()
+        with self.__pending_lock:
+            sequence = next(self.__sequence)
+            self.__ack_requests[sequence] = future
+        try:
+            self.set_clipboard(text, paste, sequence)
+        except BaseException:
+            with self.__pending_lock:
+                self.__ack_requests.pop(sequence, None)
+            raise
+        return future
+
+    def paste_text(self, text: str, timeout: Optional[float] = REQUEST_TIMEOUT) -> None:
+        """
+        Paste text of any length into the focused field through the clipboard
+
+        The text is streamed in chunks of at most CLIPBOARD_TEXT_MAX_LENGTH bytes, each chunk
+        is acknowledged by the device before the next one replaces the clipboard.
+
+        Args:
+            text: text to paste
+            timeout: seconds to wait for each acknowledgement, None waits forever
+
+        Raises:
+            ConnectionError: there is no control socket
+            TimeoutError: an acknowledgement did not come within timeout
+        """
+        for chunk in split_utf8(text, const.CLIPBOARD_TEXT_MAX_LENGTH):
+            self.set_clipboard_async(chunk, paste=True).result(timeout)
 
     @inject(const.TYPE_SET_SCREEN_POWER_MODE)
     def set_screen_power_mode(self, mode: int = scrcpy.POWER_MODE_NORMAL) -> bytes:
@@ -197,6 +448,26 @@ class ControlSender:
         """
         return b""
 
+    @inject(const.TYPE_START_APP)
+    def start_app(self, name: str) -> bytes:
+        """
+        Start an app on the display of the session
+
+        Args:
+            name: package name, prefixed with ? to search by app name instead,
+                or with + to force-stop it first
+        """
+        encoded = name.encode("utf-8")
+        assert 0 < len(encoded) <= const.START_APP_NAME_MAX_LENGTH, "name must be 1 to 255 UTF-8 bytes"
+        return struct.pack(">B", len(encoded)) + encoded
+
+    @inject(const.TYPE_RESET_VIDEO)
+    def reset_video(self) -> bytes:
+        """
+        Ask the server to restart its encoder, the stream then resumes with a keyframe
+        """
+        return b""
+
     def swipe(
         self,
         start_x: int,
@@ -223,11 +494,12 @@ class ControlSender:
         next_x = start_x
         next_y = start_y
 
-        if end_x > self.parent.resolution[0]:
-            end_x = self.parent.resolution[0]
+        width, height = self.screen_size()
+        if end_x > width:
+            end_x = width
 
-        if end_y > self.parent.resolution[1]:
-            end_y = self.parent.resolution[1]
+        if end_y > height:
+            end_y = height
 
         decrease_x = True if start_x > end_x else False
         decrease_y = True if start_y > end_y else False
@@ -256,3 +528,101 @@ class ControlSender:
                 self.touch(next_x, next_y, const.ACTION_UP)
                 break
             sleep(move_steps_delay)
+
+    def gesture(self, tracks: Sequence[gesture.PointerTrack], duration: float = 0.3, fps: int = 60) -> None:
+        """
+        Play several pointer tracks in lockstep
+
+        Each frame sends the positions of all pointers as one write, frames are scheduled
+        against absolute deadlines so the gesture does not drift with Python overhead.
+
+        Args:
+            tracks: pointer tracks, see scrcpy.gesture
+            duration: gesture duration in seconds
+            fps: pointer updates per second, usually the display refresh rate
+        """
+        assert fps > 0, "fps must be greater than 0"
+        steps = max(1, round(duration * fps))
+        with self.batch():
+            for track in tracks:
+                self.touch(*track.position(0), const.ACTION_DOWN, track.touch_id)
+
+        start = time.perf_counter()
+        for step in range(1, steps + 1):
+            sleep_until(start + step / fps)
+            with self.batch():
+                for track in tracks:
+                    self.touch(*track.position(step / steps), const.ACTION_MOVE, track.touch_id)
+                if step == steps:
+                    for track in tracks:
+                        self.touch(*track.position(1), const.ACTION_UP, track.touch_id)
+
+    def pinch(
+        self,
+        x: int,
+        y: int,
+        start_distance: int,
+        end_distance: int,
+        duration: float = 0.3,
+        angle: float = 0,
+        fingers: int = 2,
+        fps: int = 60,
+    ) -> None:
+        """
+        Pinch (end_distance < start_distance) or zoom (end_distance > start_distance) around a point
+
+        Args:
+            x: horizontal center position
+            y: vertical center position
+            start_distance: distance between opposite fingers at start
+            end_distance: distance between opposite fingers at end
+            duration: gesture duration in seconds
+            angle: angle in degrees of the first finger
+            fingers: number of fingers
+            fps: pointer updates per second
+        """
+        self.gesture(gesture.pinch_tracks((x, y), start_distance, end_distance, angle, fingers), duration, fps)
+
+    def rotate(
+        self,
+        x: int,
+        y: int,
+        radius: int,
+        degrees: float,
+        duration: float = 0.3,
+        angle: float = 0,
+        fingers: int = 2,
+        fps: int = 60,
+    ) -> None:
+        """
+        Rotate fingers around a point
+
+        Args:
+            x: horizontal center position
+            y: vertical center position
+            radius: distance between each finger and the center
+            degrees: rotation, positive is clockwise on screen
+            duration: gesture duration in seconds
+            angle: angle in degrees of the first finger
+            fingers: number of fingers
+            fps: pointer updates per second
+        """
+        self.gesture(gesture.rotate_tracks((x, y), radius, degrees, angle, fingers), duration, fps)
+
+    def multi_swipe(
+        self,
+        starts: Sequence[Tuple[int, int]],
+        ends: Sequence[Tuple[int, int]],
+        duration: float = 0.3,
+        fps: int = 60,
+    ) -> None:
+        """
+        Swipe with several fingers at once
+
+        Args:
+            starts: start position of each finger
+            ends: end position of each finger
+            duration: gesture duration in seconds
+            fps: pointer updates per second
+        """
+        self.gesture(gesture.swipe_tracks(starts, ends), duration, fps)
@@ -1,26 +1,106 @@
-import os
+import array
+import random
 import socket
 import struct
 import threading
 import time
+from concurrent.futures import Future
 from time import sleep
-from typing import Any, Callable, Optional, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
-from adbutils import AdbConnection, AdbDevice, AdbError, Network, adb
+from adbutils import AdbConnection, AdbDevice, AdbError, AdbTimeout, adb
 from av.codec import CodecContext
 from av.error import InvalidDataError
 
+try:
+    import fcntl
+    import termios
+except ImportError:  # Windows
+    fcntl = termios = None
+
 from .const import (
+    EVENT_DEVICE_MESSAGE,
     EVENT_DISCONNECT,
     EVENT_FRAME,
     EVENT_INIT,
+    EVENT_RECONNECT,
+    EVENT_STALL,
     LOCK_SCREEN_ORIENTATION_UNLOCKED,
 )
+from . import session as server_sessions
 from .control import ControlSender
+from .decode_process import DecodeProcess, ProcessStream
+from .device_message import DeviceMessage, DeviceMessageParser, DeviceMessageReader
+from .options import SERVER_VERSION, ServerOptions, capture_orientation_from_lock
+from .reconnect import ReconnectPolicy
+from .session import ServerSession, SessionKey
+from .tcp import TcpForward
+from .transport import REMOTE_JAR_PATH, AdbTransport, TcpTransport, Transport
+from .watchdog import StallInfo, StallWatchdog
+
+
+# Logged by the server right before it opens its socket
+SERVER_READY_SIGNAL = b"INFO: Device:"
+SERVER_ERROR_SIGNAL = b"ERROR:"
+# Delays between connection attempts, the last one repeats until connection_timeout
+CONNECT_BACKOFF = (0.005, 0.01, 0.02, 0.04, 0.08, 0.1)
+# Servers are told apart by a random 31-bit scid, which names their socket
+SCID_BITS = 31
+# Minimum seconds between two keyframe requests while the decoder is recovering
+KEYFRAME_REQUEST_INTERVAL = 1.0
+
+
+def socket_name(scid: int) -> str:
+    """
+    Abstract socket name of the server started with this scid
+    """
+    return f"scrcpy_{scid:08x}"
+
+
+class StreamStats:
+    def __init__(self):
+        """
+        Counters of a client's video stream, kept across reconnections
+
+        Only the thread feeding the stream, or the receiver thread of its decode process, writes them,
+        other threads may read them at any time.
+        """
+        self.bytes_received = 0
+        self.frames_decoded = 0
+        self.decode_errors = 0
+        # Packets dropped while waiting for a keyframe, and resyncs on one after a decode error
+        self.dropped_packets = 0
+        self.recoveries = 0
+        self.reconnects = 0
+        # Seconds spent in feed, decoding and in frame listeners, or by the worker process decoding
+        self.decode_time = 0.0
+        # time.monotonic() values, None until it happens
+        self.connected_at: Optional[float] = None
+        self.last_byte_at: Optional[float] = None
+        self.last_frame_at: Optional[float] = None
+        # Seconds spent in each phase of the last start: push, launch, connect, handshake, first_frame
+        self.startup: Dict[str, float] = {}
+
+    def as_dict(self) -> dict:
+        """
+        Snapshot of the counters
+        """
+        return dict(self.__dict__, startup=dict(self.startup))
 
 
 class Client:
+    """
+    Thread safety, including on free-threaded (no-GIL) builds:
+
+    - listeners may be added and removed from any thread, an event being dispatched keeps
+      the listener list it started with
+    - last_frame and resolution are published together, frame_state returns a consistent pair
+    - stop and handle_disconnect may be called from any thread, several times
+    - control messages may be sent from any thread, see ControlSender
+    - feed must be called from one thread at a time, it is what start or DeviceFleet do
+    """
+
     def __init__(
         self,
         device: Optional[Union[AdbDevice, str, any]] = None,
@@ -34,6 +114,14 @@ class Client:
         connection_timeout: int = 3000,
         encoder_name: Optional[str] = None,
         codec_name: Optional[str] = None,
+        decode_process: Optional[DecodeProcess] = None,
+        keep_session: bool = False,
+        reconnect: Optional[ReconnectPolicy] = None,
+        watchdog: Optional[StallWatchdog] = None,
+        options: Optional[ServerOptions] = None,
+        start_app: Optional[str] = None,
+        tcp: Optional[TcpForward] = None,
+        transport: Optional[Transport] = None,
     ):
         """
         Create a scrcpy client, this client won't be started until you call the start function
@@ -50,12 +138,28 @@ class Client:
             connection_timeout: timeout for connection, unit is ms
             encoder_name: encoder name, enum: [OMX.google.h264.encoder, OMX.qcom.video.encoder.avc, c2.qti.avc.encoder, c2.android.avc.encoder], default is None (Auto)
             codec_name: codec name, enum: [h264, h265, av1], default is None (Auto)
+            decode_process: decode in this worker process instead of the calling thread,
+                frames are then zero-copy views on shared memory, valid until the ring wraps
+            keep_session: on stop, keep the server running for the next client of the same device
+                and options, which then attaches to it instead of deploying, see scrcpy.session
+            reconnect: redeploy and reconnect with this policy when the stream loop loses the device,
+                listeners, stats and the control sender are kept
+            watchdog: send stall events when the stream stops making progress, checked by the
+                stream loop or DeviceFleet
+            options: server video options, replacing max_width, bitrate, max_fps, stay_awake,
+                lock_screen_orientation, encoder_name and codec_name
+            start_app: package started by every newly deployed server, on the display it streams,
+                e.g. the virtual display of options.new_display, see ControlSender.start_app
+            tcp: connect with plain TCP sockets through an adb forward, with tuned socket options,
+                instead of adb connections
+            transport: run the server and open its sockets with this transport, replacing device and tcp,
+                e.g. a ReplayTransport to decode a recorded stream without device
         """
         # Check Params
         assert max_width >= 0, "max_width must be greater than or equal to 0"
         assert bitrate >= 0, "bitrate must be greater than or equal to 0"
         assert max_fps >= 0, "max_fps must be greater than or equal to 0"
-        assert -1 <= lock_screen_orientation <= 3, "lock_screen_orientation must be LOCK_SCREEN_ORIENTATION_*"
+        assert -2 <= lock_screen_orientation <= 3, "lock_screen_orientation must be LOCK_SCREEN_ORIENTATION_*"
         assert connection_timeout >= 0, "connection_timeout must be greater than or equal to 0"
         assert encoder_name in [
             None,
@@ -77,21 +181,43 @@ class Client:
         self.connection_timeout = connection_timeout
         self.encoder_name = encoder_name
         self.codec_name = codec_name
+        self.decode_process = decode_process
+        self.keep_session = keep_session
+        self.reconnect = reconnect
+        self.watchdog = watchdog
+        if options is None:
+            options = ServerOptions(
+                max_size=max_width,
+                max_fps=max_fps,
+                video_bit_rate=bitrate,
+                video_codec=codec_name or "h264",
+                video_encoder=encoder_name or ("OMX.google.h264.encoder" if codec_name in [None, "h264"] else None),
+                capture_orientation=capture_orientation_from_lock(lock_screen_orientation),
+                stay_awake=stay_awake,
+            )
+        self.options = options
+        self.start_app = start_app
 
         # Connect to device
-        if device is None:
-            device = adb.device_list()[0]
-        elif isinstance(device, str):
-            device = adb.device(serial=device)
+        if transport is None:
+            if device is None:
+                device = adb.device_list()[0]
+            elif isinstance(device, str):
+                device = adb.device(serial=device)
+            transport = AdbTransport(device) if tcp is None else TcpTransport(device, tcp)
 
-        self.device = device
-        self.listeners = dict(frame=[], init=[], disconnect=[])
+        self.transport = transport
+        self.device = transport.device
+        self.listeners = dict(frame=[], init=[], disconnect=[], device_message=[], reconnect=[], stall=[])
 
         # User accessible
         self.last_frame: Optional[np.ndarray] = None
         self.resolution: Optional[Tuple[int, int]] = None
         self.device_name: Optional[str] = None
+        # Id of the server in use, several servers may run on one device
+        self.scid: Optional[int] = None
         self.control = ControlSender(self)
+        self.stats = StreamStats()
 
         # Need to destroy
         self.alive = False
@@ -99,90 +225,291 @@ class Client:
         self.__video_socket: Optional[socket.socket] = None
         self.control_socket: Optional[socket.socket] = None
         self.control_socket_lock = threading.Lock()
+        # Guards listeners, last_frame / resolution and the alive transitions
+        self.__state_lock = threading.RLock()
+        self.device_message_reader: Optional[DeviceMessageReader] = None
+        self.__device_message_parser = DeviceMessageParser()
+        self.__codec: Optional[CodecContext] = None
+        # Packets are dropped until a keyframe, a decode error makes it a recovery
+        self.__waiting_keyframe = True
+        self.__recovering = False
+        self.__keyframe_requested_at: Optional[float] = None
+        # Held by the stream loop while it reads and feeds, and while the server is replaced
+        self.__stream_lock = threading.RLock()
+        self.__reconfigure_lock = threading.Lock()
+        # Completed with the time of the first frame decoded after a reconfiguration
+        self.__swap_frame: Optional[Future] = None
+        self.__process_stream: Optional[ProcessStream] = None
+        # Whether the current stall was already reported
+        self.__stalled = False
+        # Whether start's stream loop reads the video socket, rather than the owner of the client
+        self.__stream_loop_driven = False
 
         # Available if start with threaded or daemon_threaded
         self.stream_loop_thread = None
 
-    def __init_server_connection(self) -> None:
+    def __init_server_connection(self, server_stream: AdbConnection, scid: int) -> ServerSession:
         """
         Connect to android server, there will be two sockets, video and control socket.
-        This method will set: video_socket, control_socket, resolution variables
-        """
-        for _ in range(self.connection_timeout // 100):
-            try:
-                self.__video_socket = self.device.create_connection(Network.LOCAL_ABSTRACT, "scrcpy")
-                break
-            except AdbError:
-                sleep(0.1)
-                pass
-        else:
-            raise ConnectionError("Failed to connect scrcpy-server after 3 seconds")
-
-        dummy_byte = self.__video_socket.recv(1)
-        if not len(dummy_byte) or dummy_byte != b"\x00":
-            raise ConnectionError("Did not receive Dummy Byte!")
 
-        self.control_socket = self.device.create_connection(Network.LOCAL_ABSTRACT, "scrcpy")
-        self.device_name = self.__video_socket.recv(64).decode("utf-8").rstrip("\x00")
-        if not len(self.device_name):
-            raise ConnectionError("Did not receive Device Name!")
+        Args:
+            server_stream: stream of the server, closed on failure
+            scid: id the server was started with
 
-        res = self.__video_socket.recv(4)
-        self.resolution = struct.unpack(">HH", res)
-        self.__video_socket.setblocking(False)
+        Returns:
+            Session with the server and its sockets, without device message reader
+        """
+        video_socket = control_socket = None
+        name = socket_name(scid)
+        try:
+            begin = time.perf_counter()
+            deadline = begin + self.connection_timeout / 1000
+            attempt = 0
+            while True:
+                try:
+                    video_socket = self.transport.open_socket(name, video=True)
+                    break
+                except (AdbError, ConnectionRefusedError):
+                    delay = CONNECT_BACKOFF[min(attempt, len(CONNECT_BACKOFF) - 1)]
+                    attempt += 1
+                    if time.perf_counter() + delay > deadline:
+                        raise ConnectionError(f"Failed to connect scrcpy-server after {self.connection_timeout} ms")
+                    sleep(delay)
+
+            dummy_byte = video_socket.recv(1)
+            if not len(dummy_byte) or dummy_byte != b"\x00":
+                raise ConnectionError("Did not receive Dummy Byte!")
+            self.stats.startup["connect"] = time.perf_counter() - begin
+            begin = time.perf_counter()
+
+            control_socket = self.transport.open_socket(name, video=False)
+            device_name = video_socket.recv(64).decode("utf-8").rstrip("\x00")
+            if not len(device_name):
+                raise ConnectionError("Did not receive Device Name!")
+
+            res = video_socket.recv(4)
+            resolution = struct.unpack(">HH", res)
+            video_socket.setblocking(False)
+            self.stats.startup["handshake"] = time.perf_counter() - begin
+        except BaseException:
+            for resource in (server_stream, control_socket, video_socket):
+                if resource is not None:
+                    resource.close()
+            raise
+        finally:
+            self.transport.release(name)
+        return ServerSession(
+            self.__session_key(), server_stream, video_socket, control_socket, None, device_name, resolution, scid
+        )
 
-    def __deploy_server(self) -> None:
+    def __server_args(self) -> List[str]:
         """
-        Deploy server to android device
+        Server options, as passed after the server version
         """
-        jar_name = "scrcpy-server.jar"
-        server_file_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), jar_name)
-        self.device.sync.push(server_file_path, f"/data/local/tmp/{jar_name}")
-        commands = [
-            f"CLASSPATH=/data/local/tmp/{jar_name}",
-            "app_process",
-            "/",
-            "com.genymobile.scrcpy.Server",
-            "3.3.1",  # Scrcpy server version
+        return [
             "log_level=info",
-            f"max_size={self.max_width}",
-            f"max_fps={self.max_fps}",
-            f"video_bit_rate={self.bitrate}",
-            f"video_encoder={self.encoder_name}" if self.encoder_name else "video_encoder=OMX.google.h264.encoder",
-            f"video_codec={self.codec_name}" if self.codec_name else "video_codec=h264",
+            *self.options.to_args(),
             "tunnel_forward=true",
             "send_frame_meta=false",
             "control=true",
             "audio=false",
-            "show_touches=false",
-            "stay_awake=false",
-            "power_off_on_close=false",
             "clipboard_autosync=false",
         ]
 
-        self.__server_stream: AdbConnection = self.device.shell(
-            commands,
-            stream=True,
-        )
+    def __session_key(self) -> SessionKey:
+        """
+        Parked sessions are shared by clients of the same device with the same server options
+        """
+        return self.transport.serial, tuple(self.__server_args())
 
-        # Wait for server to start
-        self.__server_stream.read(10)
+    def __deploy_server(self, scid: int) -> AdbConnection:
+        """
+        Deploy server to android device
 
-    def start(self, threaded: bool = False, daemon_threaded: bool = False) -> None:
+        Args:
+            scid: id of this server, so it does not conflict with others on the device
+
+        Returns:
+            Stream of the server process, closing it stops the server
         """
-        Start listening video stream
+        self.stats.startup = {}
+        begin = time.perf_counter()
+        self.transport.push_server()
+        self.stats.startup["push"] = time.perf_counter() - begin
+        begin = time.perf_counter()
+        commands = [
+            f"CLASSPATH={REMOTE_JAR_PATH}",
+            "app_process",
+            "/",
+            "com.genymobile.scrcpy.Server",
+            SERVER_VERSION,
+            f"scid={scid:08x}",
+            *self.__server_args(),
+        ]
+
+        server_stream: AdbConnection = self.transport.start_server(commands)
+
+        try:
+            self.__wait_server_ready(server_stream, begin + self.connection_timeout / 1000)
+        except ConnectionError:
+            server_stream.close()
+            raise
+        self.stats.startup["launch"] = time.perf_counter() - begin
+        return server_stream
+
+    def __start_server(self) -> ServerSession:
+        """
+        Deploy a server and connect to it, leaving the current connection untouched
+        """
+        scid = random.getrandbits(SCID_BITS)
+        return self.__init_server_connection(self.__deploy_server(scid), scid)
+
+    def __wait_server_ready(self, server_stream: AdbConnection, deadline: float) -> None:
+        """
+        Read the server output until it logs that it is about to listen
+
+        Gives up silently at the deadline or if the output is not readable, connection
+        attempts then tell whether the server is up.
 
         Args:
-            threaded: Run stream loop in a different thread to avoid blocking
-            daemon_threaded: Run stream loop in a daemon thread to avoid blocking
+            server_stream: stream of the server
+            deadline: time.perf_counter() value to give up at
+
+        Raises:
+            ConnectionError: the server logged an error or exited
+        """
+        conn: Optional[socket.socket] = getattr(server_stream, "conn", None)
+        output = b""
+        try:
+            while SERVER_READY_SIGNAL not in output:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return
+                if conn is not None:
+                    conn.settimeout(remaining)
+                chunk = server_stream.recv(4096)
+                if chunk == b"":
+                    raise ConnectionError(f"Server exited: {output.decode('utf-8', 'replace').strip()}")
+                output += chunk
+                if SERVER_ERROR_SIGNAL in output:
+                    raise ConnectionError(f"Server error: {output.decode('utf-8', 'replace').strip()}")
+        except (BlockingIOError, socket.timeout, AdbTimeout):
+            return
+        finally:
+            if conn is not None:
+                conn.settimeout(None)
+
+    def frame_state(self) -> Tuple[Optional[np.ndarray], Optional[Tuple[int, int]]]:
+        """
+        Last frame and the resolution it was decoded at, read together
+        """
+        with self.__state_lock:
+            return self.last_frame, self.resolution
+
+    @property
+    def fed_externally(self) -> bool:
+        """
+        Whether the client is connected without stream loop, its video data passed to feed by its
+        owner, e.g. DeviceFleet
+        """
+        return self.alive and not self.__stream_loop_driven
+
+    @property
+    def video_socket(self) -> Optional[socket.socket]:
+        """
+        Video socket, non-blocking, available after connect
+        """
+        return self.__video_socket
+
+    def connect(self, read_device_messages: bool = True) -> None:
+        """
+        Deploy the server and connect to it without running the stream loop
+
+        Video data must then be passed to feed, start calls this for you.
+
+        Args:
+            read_device_messages: read the control socket in a background thread,
+                disable it to pass control socket data to feed_device_messages yourself
         """
         assert self.alive is False
+        assert read_device_messages or not self.keep_session, "keep_session needs read_device_messages"
 
-        self.__deploy_server()
-        self.__init_server_connection()
+        session = server_sessions.take(self.__session_key()) if self.keep_session else None
+        if session is not None:
+            try:
+                self.__attach_session(session)
+            except (ConnectionError, OSError):
+                session.close()
+                session = None
+        if session is None:
+            self.__use_session(self.__start_server())
+        self.reset_decoder()
+        self.__device_message_parser = DeviceMessageParser()
+        self.stats.connected_at = time.monotonic()
         self.alive = True
+        if session is not None and self.device_message_reader is not None:
+            self.device_message_reader.on_message = self.__on_device_message
+            self.device_message_reader.on_close = self.__on_control_closed
+        elif read_device_messages:
+            self.device_message_reader = DeviceMessageReader(
+                self.control_socket, self.__on_device_message, self.__on_control_closed
+            )
+            self.device_message_reader.start()
+        if session is not None:
+            # The decoder was replaced, resume from a fresh keyframe
+            self.control.reset_video()
+        elif self.start_app:
+            self.control.start_app(self.start_app)
         self.__send_to_listeners(EVENT_INIT)
 
+    def __attach_session(self, session: ServerSession) -> None:
+        """
+        Take over the server and sockets of a parked session
+
+        Video encoded while the session was parked is discarded, the new decoder could not use it.
+
+        Args:
+            session: live session taken from scrcpy.session
+        """
+        self.stats.startup = {}
+        begin = time.perf_counter()
+        self.__use_session(session)
+        while True:
+            try:
+                if self.__video_socket.recv(0x10000) == b"":
+                    raise ConnectionError("Video stream is disconnected")
+            except BlockingIOError:
+                break
+        self.stats.startup["attach"] = time.perf_counter() - begin
+
+    def __use_session(self, session: ServerSession) -> None:
+        """
+        Make the server and sockets of a session the client's ones
+
+        Args:
+            session: session started by this client or taken from scrcpy.session
+        """
+        self.__server_stream = session.server_stream
+        self.__video_socket = session.video_socket
+        with self.control_socket_lock:
+            self.control_socket = session.control_socket
+        self.device_message_reader = session.device_message_reader
+        self.device_name = session.device_name
+        self.scid = session.scid
+        with self.__state_lock:
+            self.resolution = session.resolution
+
+    def start(self, threaded: bool = False, daemon_threaded: bool = False) -> None:
+        """
+        Start listening video stream
+
+        Args:
+            threaded: Run stream loop in a different thread to avoid blocking
+            daemon_threaded: Run stream loop in a daemon thread to avoid blocking
+        """
+        self.__stream_loop_driven = True
+        self.connect()
+
         if threaded or daemon_threaded:
             self.stream_loop_thread = threading.Thread(target=self.__stream_loop, daemon=daemon_threaded)
             self.stream_loop_thread.start()
@@ -192,8 +519,32 @@ class Client:
     def stop(self) -> None:
         """
         Stop listening (both threaded and blocked)
+
+        With keep_session, the server keeps running in a parked session instead of being stopped.
+        """
+        self.__release(park=self.keep_session)
+
+    def __release(self, park: bool) -> None:
+        """
+        Stop the stream, then park or close the server and its sockets
+
+        Args:
+            park: hand the server over to scrcpy.session if the sockets are still open
+        """
+        with self.__state_lock:
+            self.alive = False
+            self.__stream_loop_driven = False
+        if self.__process_stream is not None:
+            self.__process_stream.close()
+            self.__process_stream = None
+        if park and self.__park_session():
+            return
+        self.__close_connection()
+
+    def __close_connection(self) -> None:
+        """
+        Stop the server and close the sockets
         """
-        self.alive = False
         if self.__server_stream is not None:
             try:
                 self.__server_stream.close()
@@ -212,56 +563,436 @@ class Client:
             except Exception:
                 pass
 
+    def __park_session(self) -> bool:
+        """
+        Hand the server and sockets over to a parked session
+
+        Returns:
+            Whether the session was parked, False if there is nothing alive to park
+        """
+        if self.__video_socket is None or self.control_socket is None or self.device_message_reader is None:
+            return False
+        # The stream loop must not read the socket once the next client owns it
+        thread = self.stream_loop_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(1)
+        session = ServerSession(
+            self.__session_key(),
+            self.__server_stream,
+            self.__video_socket,
+            self.control_socket,
+            self.device_message_reader,
+            self.device_name,
+            self.resolution,
+            self.scid,
+        )
+        if not session.alive:
+            return False
+        server_sessions.park(session)
+        self.__server_stream = None
+        self.__video_socket = None
+        # A message being written finishes before the next client owns the socket
+        with self.control_socket_lock:
+            self.control_socket = None
+        self.device_message_reader = None
+        # Answers to pending requests now go to the next client
+        self.control.cancel_pending(ConnectionError("Client is stopped"))
+        return True
+
+    def reset_decoder(self) -> None:
+        """
+        Replace the decoder by a new one, which waits for the next keyframe
+        """
+        self.__codec = CodecContext.create(self.options.decoder_name, "r")
+        self.__waiting_keyframe = True
+        self.__recovering = False
+        if self.decode_process is not None:
+            if self.__process_stream is not None:
+                self.__process_stream.close()
+            self.__process_stream = self.decode_process.open_stream(self.__publish_frame, self.options.decoder_name, self.flip)
+            self.__process_stream.on_error = self.__on_process_error
+            self.__process_stream.on_recovered = self.__on_process_recovered
+            self.__process_stream.on_decoded = self.__on_process_decoded
+
+    def feed(self, data: bytes) -> None:
+        """
+        Decode video stream data and send the frames to listeners
+
+        Calls must not overlap, a single decoder keeps the stream state.
+
+        After a decode error, packets are dropped until the next keyframe instead of decoding
+        frames with corrupted references, and the server is asked for a keyframe right away.
+
+        Args:
+            data: bytes received from the video socket
+
+        Raises:
+            InvalidDataError: the decoder could not parse the data
+        """
+        self.stats.bytes_received += len(data)
+        self.stats.last_byte_at = time.monotonic()
+        if self.__process_stream is not None:
+            self.__process_stream.feed(data)
+            return
+        begin = time.perf_counter()
+        try:
+            for packet in self.__codec.parse(data):
+                if self.__waiting_keyframe:
+                    if not packet.is_keyframe:
+                        self.stats.dropped_packets += 1
+                        if self.__recovering:
+                            self.__request_keyframe()
+                        continue
+                    self.__waiting_keyframe = False
+                try:
+                    frames = self.__codec.decode(packet)
+                except InvalidDataError:
+                    self.__on_decode_error()
+                    continue
+                if self.__recovering:
+                    self.__recovering = False
+                    self.stats.recoveries += 1
+                for frame in frames:
+                    frame = frame.to_ndarray(format="bgr24")
+                    if self.flip:
+                        frame = frame[:, ::-1, :]
+                        frame = np.ascontiguousarray(frame)
+                    self.__publish_frame(frame)
+        except InvalidDataError:
+            self.__on_decode_error()
+            raise
+        finally:
+            self.stats.decode_time += time.perf_counter() - begin
+
+    def pending_bytes(self) -> int:
+        """
+        Bytes received by the system but not read from the video socket yet, 0 if unknown
+        """
+        sock = self.__video_socket
+        if fcntl is None or sock is None or not hasattr(sock, "fileno") or sock.fileno() == -1:
+            return 0
+        buffer = array.array("i", [0])
+        try:
+            fcntl.ioctl(sock.fileno(), termios.FIONREAD, buffer)
+        except OSError:
+            return 0
+        return buffer[0]
+
+    def reconfigure(self, **changes) -> Optional[float]:
+        """
+        Change server options, restarting the server if connected
+
+        The new server is started while the current one keeps streaming, then the sockets and
+        the decoder are swapped, so frames only stop until the first keyframe of the new server.
+        Listeners, stats and the control sender are kept. Only for clients run by start: the
+        owner of a client fed externally, e.g. DeviceFleet, would not read the new sockets.
+
+        Args:
+            **changes: ServerOptions fields
+
+        Returns:
+            Milliseconds between the last frame of the old server and the first one of the new
+            server, None if not measured: not connected, no frame before, called from the stream
+            loop, or no frame within connection_timeout
+
+        Raises:
+            ValidationError: invalid options, nothing is changed
+            AdbError, ConnectionError, OSError: the new server could not be started,
+                the stream loop then handles it as a lost connection
+            RuntimeError: the client is fed externally, nothing is changed
+        """
+        if self.fed_externally:
+            raise RuntimeError("reconfigure needs the stream loop of start, this client is fed externally")
+        options = ServerOptions.model_validate(dict(self.options.model_dump(), **changes))
+        with self.__reconfigure_lock:
+            with self.__stream_lock:
+                self.options = options
+                if not self.alive:
+                    return None
+            try:
+                session = self.__start_server()
+            except (AdbError, ConnectionError, OSError):
+                session = None
+            first_frame = Future()
+            with self.__stream_lock:
+                last_frame_at = self.stats.last_frame_at
+                if session is None:
+                    # Some devices run one encoder at a time, replace the server instead
+                    connected = self.__redeploy()
+                else:
+                    connected = self.__install_session(session, self.device_message_reader is not None)
+                if not connected:
+                    return None
+                self.__swap_frame = first_frame
+
+        if last_frame_at is None or threading.current_thread() is self.stream_loop_thread:
+            return None
+        try:
+            first_frame_at = first_frame.result(self.connection_timeout / 1000)
+        except TimeoutError:
+            return None
+        return (first_frame_at - last_frame_at) * 1000
+
+    def __on_decode_error(self) -> None:
+        """
+        Count a decode error and resync on the next keyframe
+        """
+        self.stats.decode_errors += 1
+        self.__waiting_keyframe = True
+        self.__recovering = True
+        self.__request_keyframe()
+
+    def __request_keyframe(self) -> None:
+        """
+        Send a reset video request, at most once per KEYFRAME_REQUEST_INTERVAL
+        """
+        now = time.monotonic()
+        if not self.alive or self.control_socket is None:
+            return
+        if self.__keyframe_requested_at is not None and now - self.__keyframe_requested_at < KEYFRAME_REQUEST_INTERVAL:
+            return
+        self.__keyframe_requested_at = now
+        try:
+            self.control.reset_video()
+        except OSError:
+            pass
+
+    def __publish_frame(self, frame: np.ndarray, seq: Optional[int] = None) -> None:
+        """
+        Store a decoded frame and send it to listeners
+
+        Args:
+            frame: bgr24 frame
+            seq: sequence number in the shared memory ring, if decoded by a worker process
+        """
+        with self.__state_lock:
+            self.last_frame = frame
+            self.resolution = (frame.shape[1], frame.shape[0])
+        if "first_frame" not in self.stats.startup and self.stats.connected_at is not None:
+            self.stats.startup["first_frame"] = time.monotonic() - self.stats.connected_at
+        self.stats.frames_decoded += 1
+        self.stats.last_frame_at = time.monotonic()
+        swap_frame = self.__swap_frame
+        if swap_frame is not None:
+            self.__swap_frame = None
+            swap_frame.set_result(self.stats.last_frame_at)
+        self.__send_to_listeners(EVENT_FRAME, frame)
+
+    def __on_process_error(self, _: str) -> None:
+        """
+        Count decode errors reported by the worker process, which resyncs on the next keyframe
+        """
+        self.stats.decode_errors += 1
+        self.__request_keyframe()
+
+    def __on_process_recovered(self, dropped: int) -> None:
+        """
+        Count a resync of the worker process
+
+        Args:
+            dropped: packets dropped while waiting for the keyframe
+        """
+        self.stats.dropped_packets += dropped
+        self.stats.recoveries += 1
+
+    def __on_process_decoded(self, seconds: float) -> None:
+        """
+        Count the time the worker process spent decoding, feed only hands the data over
+
+        Args:
+            seconds: decoding time of one piece of data
+        """
+        self.stats.decode_time += seconds
+
+    def feed_device_messages(self, data: bytes) -> None:
+        """
+        Parse control socket data and dispatch the device messages,
+        only needed when connected with read_device_messages=False
+
+        Args:
+            data: bytes received from the control socket
+        """
+        for message in self.__device_message_parser.feed(data):
+            self.__on_device_message(message)
+
+    def handle_disconnect(self) -> None:
+        """
+        Notify disconnect listeners and stop, if still alive
+        """
+        with self.__state_lock:
+            if not self.alive:
+                return
+            self.alive = False
+        self.__send_to_listeners(EVENT_DISCONNECT)
+        self.__release(park=False)
+        self.__on_control_closed()
+
+    def recover(self) -> bool:
+        """
+        Handle a lost connection: reconnect following the reconnect policy, or disconnect
+
+        The stream loop does it by itself, loops driving clients without it call it instead of
+        handle_disconnect, like DeviceFleet. It blocks until the policy succeeds or gives up.
+
+        Returns:
+            Whether the client is connected again
+        """
+        if not self.alive:
+            return False
+        if self.reconnect is not None and self.__reconnect():
+            return True
+        self.handle_disconnect()
+        return False
+
+    def check_stall(self) -> Optional[StallInfo]:
+        """
+        Check the stream against the watchdog, sending a stall event the first time a stall is seen
+
+        Returns:
+            Diagnostics when a stall starts, None while healthy or already reported
+        """
+        if self.watchdog is None or not self.alive:
+            return None
+        stall = self.watchdog.check(self.stats)
+        if stall is None or self.__stalled:
+            self.__stalled = stall is not None
+            return None
+        self.__stalled = True
+        self.__send_to_listeners(EVENT_STALL, stall)
+        return stall
+
     def __stream_loop(self) -> None:
         """
         Core loop for video parsing
         """
-        codec = CodecContext.create("h264", "r")
         while self.alive:
             try:
-                raw_h264 = self.__video_socket.recv(0x10000)
-                if raw_h264 == b"":
-                    raise ConnectionError("Video stream is disconnected")
-                packets = codec.parse(raw_h264)
-                for packet in packets:
-                    frames = codec.decode(packet)
-                    for frame in frames:
-                        frame = frame.to_ndarray(format="bgr24")
-                        if self.flip:
-                            frame = frame[:, ::-1, :]
-                            frame = np.ascontiguousarray(frame)
-                        self.last_frame = frame
-                        self.resolution = (frame.shape[1], frame.shape[0])
-                        self.__send_to_listeners(EVENT_FRAME, frame)
+                with self.__stream_lock:
+                    stall = self.check_stall()
+                    if stall is not None and self.watchdog.restart:
+                        idle = stall.byte_idle if stall.reason == "bytes" else stall.frame_idle
+                        raise ConnectionError(f"Video stream stalled, no {stall.reason} for {idle:.1f} s")
+                    raw_h264 = self.__video_socket.recv(0x10000)
+                    if raw_h264 == b"":
+                        raise ConnectionError("Video stream is disconnected")
+                    self.feed(raw_h264)
             except (BlockingIOError, InvalidDataError):
                 time.sleep(0.01)
                 if not self.block_frame:
                     self.__send_to_listeners(EVENT_FRAME, None)
             except (ConnectionError, OSError) as e:  # Socket Closed
                 if self.alive:
-                    self.__send_to_listeners(EVENT_DISCONNECT)
-                    self.stop()
+                    if self.recover():
+                        continue
                     raise e
 
+    def __reconnect(self) -> bool:
+        """
+        Redeploy the server and connect to it again, following the reconnect policy
+
+        Returns:
+            Whether the client is connected again, False once the policy gives up or on stop
+        """
+        self.__close_connection()
+        for attempt, delay in enumerate(self.reconnect.delays()):
+            sleep(delay)
+            if not self.alive:
+                return False
+            try:
+                with self.__stream_lock:
+                    if not self.__redeploy():
+                        return False
+            except (AdbError, ConnectionError, OSError):
+                continue
+            self.stats.reconnects += 1
+            self.__send_to_listeners(EVENT_RECONNECT, attempt + 1)
+            return True
+        return False
+
+    def __redeploy(self) -> bool:
+        """
+        Replace the server and its sockets by new ones, keeping listeners, stats and the control sender
+
+        Returns:
+            Whether the client is connected to the new server, False if it was stopped meanwhile
+
+        Raises:
+            AdbError, ConnectionError, OSError: the new server could not be started
+        """
+        read_device_messages = self.device_message_reader is not None
+        self.__close_connection()
+        return self.__install_session(self.__start_server(), read_device_messages)
+
+    def __install_session(self, session: ServerSession, read_device_messages: bool) -> bool:
+        """
+        Replace the current connection by a freshly started one, with a new decoder
+
+        Args:
+            session: new server and sockets
+            read_device_messages: start a device message reader on the new control socket
+
+        Returns:
+            Whether the session was installed, False if the client was stopped meanwhile
+        """
+        with self.__state_lock:
+            if not self.alive:
+                session.close()
+                return False
+            self.__close_connection()
+            self.__use_session(session)
+            # The new server starts with a keyframe, which the new decoder waits for
+            self.reset_decoder()
+            self.stats.connected_at = time.monotonic()
+            if read_device_messages:
+                self.device_message_reader = DeviceMessageReader(
+                    self.control_socket, self.__on_device_message, self.__on_control_closed
+                )
+                self.device_message_reader.start()
+            if self.start_app:
+                # A new virtual display is empty
+                self.control.start_app(self.start_app)
+        return True
+
+    def __on_device_message(self, message: DeviceMessage) -> None:
+        """
+        Dispatch a message read from the control socket
+
+        Args:
+            message: parsed device message
+        """
+        self.control.handle_device_message(message)
+        self.__send_to_listeners(EVENT_DEVICE_MESSAGE, message)
+
+    def __on_control_closed(self) -> None:
+        """
+        Fail requests still waiting for an answer once the control socket is closed
+        """
+        self.control.cancel_pending(ConnectionError("Control socket is closed"))
+
     def add_listener(self, cls: str, listener: Callable[..., Any]) -> None:
         """
         Add a video listener
 
         Args:
-            cls: Listener category, support: init, frame
+            cls: Listener category, support: init, frame, disconnect, device_message, reconnect, stall
             listener: A function to receive frame np.ndarray
         """
-        self.listeners[cls].append(listener)
+        with self.__state_lock:
+            # Copy on write, so dispatching never iterates a list being modified
+            self.listeners[cls] = self.listeners[cls] + [listener]
 
     def remove_listener(self, cls: str, listener: Callable[..., Any]) -> None:
         """
         Remove a video listener
 
         Args:
-            cls: Listener category, support: init, frame
+            cls: Listener category, support: init, frame, disconnect, device_message, reconnect, stall
             listener: A function to receive frame np.ndarray
         """
-        self.listeners[cls].remove(listener)
+        with self.__state_lock:
+            listeners = list(self.listeners[cls])
+            listeners.remove(listener)
+            self.listeners[cls] = listeners
 
     def __send_to_listeners(self, cls: str, *args, **kwargs) -> None:
         """
@@ -0,0 +1,221 @@
+"""
+Decode video streams in a worker process, frames are delivered through shared memory rings
+"""
+
+import itertools
+import multiprocessing
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from .shm import FrameRing
+
+# Extra room so rings survive small resolution changes without being recreated
+SLOT_MARGIN = 1.25
+
+
+def _worker(conn, slots: int) -> None:
+    """
+    Worker process loop, messages are tuples starting with a command name
+    """
+    from av.codec import CodecContext
+    from av.error import InvalidDataError
+
+    streams: Dict[int, dict] = {}
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        command, stream_id = message[0], message[1]
+        if command == "stop":
+            break
+        elif command == "open":
+            streams[stream_id] = dict(
+                codec=CodecContext.create(message[2], "r"), flip=message[3], ring=None, waiting=True, dropped=None
+            )
+        elif command == "close":
+            stream = streams.pop(stream_id, None)
+            if stream is not None and stream["ring"] is not None:
+                stream["ring"].close()
+        elif command == "data":
+            stream = streams.get(stream_id)
+            if stream is None:
+                continue
+            begin = time.perf_counter()
+            try:
+                for packet in stream["codec"].parse(message[2]):
+                    # After an error, dropped counts the packets skipped until the next keyframe
+                    if stream["waiting"]:
+                        if not packet.is_keyframe:
+                            if stream["dropped"] is not None:
+                                stream["dropped"] += 1
+                            continue
+                        stream["waiting"] = False
+                    try:
+                        frames = stream["codec"].decode(packet)
+                    except InvalidDataError:
+                        stream["waiting"], stream["dropped"] = True, 0
+                        conn.send(("error", stream_id, "InvalidDataError"))
+                        continue
+                    if stream["dropped"] is not None:
+                        conn.send(("recovered", stream_id, stream["dropped"]))
+                        stream["dropped"] = None
+                    for frame in frames:
+                        pts = frame.pts if frame.pts is not None else time.monotonic_ns()
+                        frame = frame.to_ndarray(format="bgr24")
+                        if stream["flip"]:
+                            frame = frame[:, ::-1, :]
+                        ring: Optional[FrameRing] = stream["ring"]
+                        if ring is None or frame.nbytes > ring.slot_size:
+                            if ring is not None:
+                                ring.close()
+                            ring = stream["ring"] = FrameRing.create(slots, int(frame.nbytes * SLOT_MARGIN))
+                            conn.send(("ring", stream_id, ring.name))
+                        conn.send(("frame", stream_id, ring.write(frame, pts)))
+            except InvalidDataError:
+                stream["waiting"], stream["dropped"] = True, 0
+                conn.send(("error", stream_id, "InvalidDataError"))
+            conn.send(("decoded", stream_id, time.perf_counter() - begin))
+
+    for stream in streams.values():
+        if stream["ring"] is not None:
+            stream["ring"].close()
+    conn.close()
+
+
+class ProcessStream:
+    def __init__(self, process: "DecodeProcess", stream_id: int, on_frame: Callable[[np.ndarray, int], None]):
+        """
+        One video stream decoded by a DecodeProcess, see DecodeProcess.open_stream
+        """
+        self.process = process
+        self.stream_id = stream_id
+        self.on_frame = on_frame
+        self.on_error: Optional[Callable[[str], None]] = None
+        # Called with the number of packets dropped, once resynced on a keyframe after an error
+        self.on_recovered: Optional[Callable[[int], None]] = None
+        # Called with the seconds the worker spent decoding each piece of data fed
+        self.on_decoded: Optional[Callable[[float], None]] = None
+        self.ring: Optional[FrameRing] = None
+
+    def feed(self, data: bytes) -> None:
+        """
+        Send video stream data to the worker process
+
+        Args:
+            data: bytes received from the video socket
+        """
+        self.process.send(("data", self.stream_id, data))
+
+    def close(self) -> None:
+        """
+        Stop decoding this stream and release its ring
+        """
+        self.process.close_stream(self)
+
+
+class DecodeProcess:
+    def __init__(self, slots: int = 4):
+        """
+        A worker process decoding one or more video streams
+
+        Decoded frames are written to a shared memory ring per stream, the parent process
+        receives zero-copy ndarray views on them with their sequence numbers.
+
+        Args:
+            slots: frames kept per stream, a view is overwritten slots frames after its delivery
+        """
+        context = multiprocessing.get_context("spawn")
+        self.__conn, child_conn = context.Pipe()
+        self.__send_lock = threading.Lock()
+        self.__streams: Dict[int, ProcessStream] = {}
+        # Rings are released under this lock so the receiver never reads a closed one
+        self.__streams_lock = threading.RLock()
+        self.__ids = itertools.count()
+        self.process = context.Process(target=_worker, args=(child_conn, slots), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.receiver_thread = threading.Thread(target=self.__receive_loop, daemon=True)
+        self.receiver_thread.start()
+
+    def send(self, message: tuple) -> None:
+        with self.__send_lock:
+            self.__conn.send(message)
+
+    def open_stream(self, on_frame: Callable[[np.ndarray, int], None], codec_name: str = "h264", flip: bool = False):
+        """
+        Start decoding a new stream
+
+        Args:
+            on_frame: called from the receiver thread with each frame view and its sequence number
+            codec_name: PyAV decoder name, h264 | hevc | av1
+            flip: flip the video horizontally
+
+        Returns:
+            ProcessStream to feed the stream data to
+        """
+        stream = ProcessStream(self, next(self.__ids), on_frame)
+        self.__streams[stream.stream_id] = stream
+        self.send(("open", stream.stream_id, codec_name, flip))
+        return stream
+
+    def close_stream(self, stream: ProcessStream) -> None:
+        with self.__streams_lock:
+            if self.__streams.pop(stream.stream_id, None) is None:
+                return
+            if stream.ring is not None:
+                stream.ring.close()
+                stream.ring = None
+        try:
+            self.send(("close", stream.stream_id))
+        except (OSError, ValueError):
+            pass
+
+    def close(self) -> None:
+        """
+        Stop the worker process
+        """
+        for stream in list(self.__streams.values()):
+            stream.close()
+        try:
+            self.send(("stop", None))
+        except (OSError, ValueError):
+            pass
+        self.process.join(5)
+        self.receiver_thread.join(5)
+        self.__conn.close()
+
+    def __receive_loop(self) -> None:
+        while True:
+            try:
+                command, stream_id, value = self.__conn.recv()
+            except (EOFError, OSError):
+                break
+            with self.__streams_lock:
+                self.__handle(command, stream_id, value)
+
+    def __handle(self, command: str, stream_id: int, value) -> None:
+        stream = self.__streams.get(stream_id)
+        if stream is None:
+            return
+        if command == "ring":
+            if stream.ring is not None:
+                stream.ring.close()
+            try:
+                stream.ring = FrameRing.attach(value)
+            except FileNotFoundError:
+                # Already replaced by a newer ring
+                stream.ring = None
+        elif command == "frame" and stream.ring is not None:
+            frame = stream.ring.read(value)
+            if frame is not None:
+                stream.on_frame(frame.frame, frame.seq)
+        elif command == "error" and stream.on_error is not None:
+            stream.on_error(value)
+        elif command == "recovered" and stream.on_recovered is not None:
+            stream.on_recovered(value)
+        elif command == "decoded" and stream.on_decoded is not None:
+            stream.on_decoded(value)
@@ -0,0 +1,146 @@
+"""
+Messages sent by the server on the control socket, and a background reader for them
+"""
+
+import struct
+import threading
+from time import sleep
+from typing import Callable, List, NamedTuple, Optional, Union
+
+from .const import (
+    DEVICE_MSG_TYPE_ACK_CLIPBOARD,
+    DEVICE_MSG_TYPE_CLIPBOARD,
+    DEVICE_MSG_TYPE_UHID_OUTPUT,
+)
+
+
+class ClipboardMessage(NamedTuple):
+    """
+    Device clipboard content, answer to a get clipboard request
+    """
+
+    text: str
+
+
+class AckClipboardMessage(NamedTuple):
+    """
+    Acknowledgement of a set clipboard request carrying a sequence number
+    """
+
+    sequence: int
+
+
+class UhidOutputMessage(NamedTuple):
+    """
+    Output report of a UHID device, e.g. keyboard leds
+    """
+
+    id: int
+    data: bytes
+
+
+DeviceMessage = Union[ClipboardMessage, AckClipboardMessage, UhidOutputMessage]
+
+
+class DeviceMessageParser:
+    def __init__(self):
+        """
+        Incremental parser, bytes may be fed in chunks of any size
+        """
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[DeviceMessage]:
+        """
+        Parse received bytes
+
+        Args:
+            data: bytes received from the control socket
+
+        Returns:
+            All messages completed by these bytes
+        """
+        self.buffer += data
+        messages = []
+        while True:
+            message = self.__parse_one()
+            if message is None:
+                return messages
+            messages.append(message)
+
+    def __parse_one(self) -> Optional[DeviceMessage]:
+        buffer = self.buffer
+        if not buffer:
+            return None
+
+        msg_type = buffer[0]
+        if msg_type == DEVICE_MSG_TYPE_CLIPBOARD:
+            if len(buffer) < 5:
+                return None
+            (length,) = struct.unpack_from(">I", buffer, 1)
+            if len(buffer) < 5 + length:
+                return None
+            message = ClipboardMessage(bytes(buffer[5 : 5 + length]).decode("utf-8"))
+            del buffer[: 5 + length]
+        elif msg_type == DEVICE_MSG_TYPE_ACK_CLIPBOARD:
+            if len(buffer) < 9:
+                return None
+            (sequence,) = struct.unpack_from(">Q", buffer, 1)
+            message = AckClipboardMessage(sequence)
+            del buffer[:9]
+        elif msg_type == DEVICE_MSG_TYPE_UHID_OUTPUT:
+            if len(buffer) < 5:
+                return None
+            uhid_id, size = struct.unpack_from(">HH", buffer, 1)
+            if len(buffer) < 5 + size:
+                return None
+            message = UhidOutputMessage(uhid_id, bytes(buffer[5 : 5 + size]))
+            del buffer[: 5 + size]
+        else:
+            raise ValueError(f"Unknown device message type: {msg_type}")
+        return message
+
+
+class DeviceMessageReader:
+    def __init__(
+        self,
+        sock,
+        on_message: Callable[[DeviceMessage], None],
+        on_close: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Read and parse device messages in a daemon thread, so control writes never wait on reads
+
+        Args:
+            sock: control socket
+            on_message: called from the reader thread with every parsed message
+            on_close: called from the reader thread once the socket is closed
+        """
+        self.sock = sock
+        self.on_message = on_message
+        self.on_close = on_close
+        self.parser = DeviceMessageParser()
+        self.thread = threading.Thread(target=self.__loop, daemon=True)
+
+    def start(self) -> None:
+        """
+        Start the reader thread
+        """
+        self.thread.start()
+
+    def __loop(self) -> None:
+        try:
+            while True:
+                try:
+                    data = self.sock.recv(0x10000)
+                except BlockingIOError:
+                    sleep(0.01)
+                    continue
+                if data == b"":
+                    break
+                for message in self.parser.feed(data):
+                    self.on_message(message)
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            if self.on_close is not None:
+                self.on_close()
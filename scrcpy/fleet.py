@@ -0,0 +1,389 @@
+"""
+Run many clients from one selector loop and a shared decoding pool
+"""
+
+import collections
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Sequence, Set
+
+from av.error import InvalidDataError
+
+from .core import Client
+from .decode_process import DecodeProcess
+
+# Seconds between two checks of the stall watchdogs
+WATCHDOG_INTERVAL = 0.1
+
+
+class StartResult(NamedTuple):
+    """
+    Outcome of starting one client in a batch
+    """
+
+    client: Client
+    elapsed: float  # seconds
+    error: Optional[Exception]
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _run_batch(clients: Sequence[Client], start: Callable[[Client], None], max_workers: int) -> List[StartResult]:
+    def run(client: Client) -> StartResult:
+        begin = time.perf_counter()
+        try:
+            start(client)
+            error = None
+        except Exception as e:
+            error = e
+        return StartResult(client, time.perf_counter() - begin, error)
+
+    with ThreadPoolExecutor(max_workers, thread_name_prefix="scrcpy-start") as pool:
+        return list(pool.map(run, clients))
+
+
+def start_all(clients: Sequence[Client], max_workers: int = 8, daemon_threaded: bool = True) -> List[StartResult]:
+    """
+    Deploy and connect many clients concurrently, each running its stream loop in a thread
+
+    A failing device does not abort the batch, its exception is returned in its result.
+
+    Args:
+        clients: clients which are not started
+        max_workers: number of devices started at the same time
+        daemon_threaded: run the stream loops in daemon threads
+
+    Returns:
+        One result per client, in the same order
+    """
+    assert max_workers > 0, "max_workers must be greater than 0"
+    return _run_batch(clients, lambda client: client.start(threaded=True, daemon_threaded=daemon_threaded), max_workers)
+
+
+class _FleetDevice:
+    def __init__(self, client: Client, name: str):
+        self.client = client
+        self.name = name
+        self.chunks: Deque[bytes] = collections.deque()
+        self.decoding = False
+        self.error: Optional[str] = None
+
+
+class DeviceFleet:
+    def __init__(self, workers: int = 4, decode_processes: int = 0):
+        """
+        Multiplex the video and control sockets of many clients through one selector loop
+
+        Socket reads happen in the loop thread, decoding is dispatched to a pool of workers,
+        each device being decoded by at most one worker at a time to keep its stream in order.
+        Adding a device costs its sockets, not a thread. The loop also checks the clients'
+        stall watchdogs, a client whose watchdog restarts on stall loses its connection.
+        A client losing its connection is reconnected by its reconnect policy in a background
+        thread and attached again, or disconnected without policy or once it gives up.
+
+        With decode_processes, the pool only forwards stream data to worker processes which
+        decode it, devices being spread over them, and frames come back through shared memory.
+        The processes are started by start, or by the first add, and closed by stop.
+
+        Args:
+            workers: size of the decoding pool
+            decode_processes: number of decoding worker processes, 0 decodes in the pool threads
+        """
+        assert workers > 0, "workers must be greater than 0"
+        assert decode_processes >= 0, "decode_processes must be greater than or equal to 0"
+        self.workers = workers
+        self.decode_process_count = decode_processes
+        self.decode_processes: List[DecodeProcess] = []
+        self.alive = False
+        self.loop_thread: Optional[threading.Thread] = None
+
+        self.__devices: Dict[int, _FleetDevice] = {}
+        self.__lock = threading.Lock()
+        self.__selector = selectors.DefaultSelector()
+        self.__pool: Optional[ThreadPoolExecutor] = None
+        self.__registrations: Deque[_FleetDevice] = collections.deque()
+        self.__removals: Deque[_FleetDevice] = collections.deque()
+        self.__registered: Set[_FleetDevice] = set()
+        # Written to wake up the selector when devices are added
+        self.__wakeup_r, self.__wakeup_w = socket.socketpair()
+        self.__wakeup_r.setblocking(False)
+        self.__selector.register(self.__wakeup_r, selectors.EVENT_READ, None)
+
+    @staticmethod
+    def key(client: Client) -> int:
+        """
+        Key of a client in the fleet, one per client since a device may stream several sessions
+        """
+        return id(client)
+
+    def __name(self, serial: Optional[str]) -> str:
+        """
+        Name of a new client in status, its serial, numbered from the second session of a device
+        """
+        names = {device.name for device in self.__devices.values()}
+        name, index = str(serial), 2
+        while name in names:
+            name, index = f"{serial}#{index}", index + 1
+        return name
+
+    def add(self, client: Client) -> Client:
+        """
+        Connect a client and attach it to the loop
+
+        Args:
+            client: a client which is not started
+
+        Returns:
+            The same client
+        """
+        if self.decode_process_count and client.decode_process is None:
+            with self.__lock:
+                self.__start_decode_processes()
+                client.decode_process = self.decode_processes[len(self.__devices) % len(self.decode_processes)]
+        client.connect(read_device_messages=False)
+        with self.__lock:
+            device = _FleetDevice(client, self.__name(client.transport.serial))
+            self.__devices[self.key(client)] = device
+            self.__registrations.append(device)
+        self.__wakeup_w.send(b"\x00")
+        return client
+
+    def add_all(self, clients: Sequence[Client], max_workers: int = 8) -> List[StartResult]:
+        """
+        Connect many clients concurrently and attach them to the loop
+
+        A failing device does not abort the batch, its exception is returned in its result.
+
+        Args:
+            clients: clients which are not started
+            max_workers: number of devices connected at the same time
+
+        Returns:
+            One result per client, in the same order
+        """
+        assert max_workers > 0, "max_workers must be greater than 0"
+        return _run_batch(clients, self.add, max_workers)
+
+    def remove(self, client: Client) -> None:
+        """
+        Stop a client and detach it from the loop
+
+        Args:
+            client: a client previously added
+        """
+        with self.__lock:
+            device = self.__devices.pop(self.key(client), None)
+            if device is not None and self.alive:
+                # Sockets are unregistered by the loop before being closed
+                self.__removals.append(device)
+                device = None
+        if device is not None:
+            client.stop()
+        self.__wakeup_w.send(b"\x00")
+
+    def status(self) -> Dict[str, dict]:
+        """
+        Status of every client
+
+        Returns:
+            Mapping of name to the client's stream stats, with its serial, the alive flag,
+            the bytes waiting to be decoded and the last error. The name is the serial,
+            followed by #2, #3... for the next clients of the same device.
+        """
+        with self.__lock:
+            devices = list(self.__devices.values())
+        return {
+            device.name: dict(
+                device.client.stats.as_dict(),
+                serial=device.client.transport.serial,
+                alive=device.client.alive,
+                backlog=sum(len(c) for c in list(device.chunks)),
+                error=device.error,
+            )
+            for device in devices
+        }
+
+    def start(self, threaded: bool = False, daemon_threaded: bool = False) -> None:
+        """
+        Start the selector loop
+
+        Args:
+            threaded: Run the loop in a different thread to avoid blocking
+            daemon_threaded: Run the loop in a daemon thread to avoid blocking
+        """
+        assert self.alive is False
+        self.alive = True
+        with self.__lock:
+            self.__start_decode_processes()
+        self.__pool = ThreadPoolExecutor(self.workers, thread_name_prefix="scrcpy-decode")
+        if threaded or daemon_threaded:
+            self.loop_thread = threading.Thread(target=self.__loop, daemon=daemon_threaded)
+            self.loop_thread.start()
+        else:
+            self.__loop()
+
+    def stop(self) -> None:
+        """
+        Stop the loop and every client
+        """
+        self.alive = False
+        self.__wakeup_w.send(b"\x00")
+        if self.loop_thread is not None and self.loop_thread is not threading.current_thread():
+            self.loop_thread.join()
+        with self.__lock:
+            devices = list(self.__devices.values())
+            self.__devices.clear()
+        for device in devices:
+            device.client.stop()
+        if self.__pool is not None:
+            self.__pool.shutdown(wait=True)
+        with self.__lock:
+            processes = self.decode_processes
+            self.decode_processes = []
+        for process in processes:
+            process.close()
+
+    def __start_decode_processes(self) -> None:
+        """
+        Start the decoding worker processes if they are not running, under the lock
+        """
+        if not self.decode_processes:
+            self.decode_processes = [DecodeProcess() for _ in range(self.decode_process_count)]
+
+    def __loop(self) -> None:
+        next_check = 0.0
+        while self.alive:
+            self.__update_registrations()
+            if time.monotonic() >= next_check:
+                next_check = time.monotonic() + WATCHDOG_INTERVAL
+                self.__check_stalls()
+            for key, _ in self.__selector.select(timeout=WATCHDOG_INTERVAL):
+                if key.data is None:
+                    try:
+                        self.__wakeup_r.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                device, is_video = key.data
+                if device not in self.__registered:
+                    continue
+                try:
+                    data = key.fileobj.recv(0x10000)
+                    if data == b"":
+                        raise ConnectionError(f"{'Video' if is_video else 'Control'} stream is disconnected")
+                except BlockingIOError:
+                    continue
+                except (ConnectionError, OSError) as e:
+                    self.__lost(device, str(e))
+                    continue
+
+                if is_video:
+                    self.__queue_video(device, data)
+                else:
+                    device.client.feed_device_messages(data)
+
+        self.__update_registrations()
+        for device in list(self.__registered):
+            self.__unregister(device)
+
+    def __check_stalls(self) -> None:
+        for device in list(self.__registered):
+            client = device.client
+            stall = client.check_stall()
+            if stall is not None and client.watchdog.restart:
+                self.__lost(device, f"Video stream stalled, no {stall.reason}")
+
+    def __lost(self, device: _FleetDevice, error: str) -> None:
+        """
+        Detach a device whose connection is lost, then reconnect or disconnect its client
+
+        Args:
+            device: registered device
+            error: reason, kept in the status
+        """
+        client = device.client
+        if client.alive:
+            device.error = error
+        self.__unregister(device)
+        if client.reconnect is None:
+            client.handle_disconnect()
+            return
+        # Following the policy blocks, the loop keeps serving the other devices
+        threading.Thread(target=self.__recover, args=(device,), name="scrcpy-reconnect", daemon=True).start()
+
+    def __recover(self, device: _FleetDevice) -> None:
+        # Data of the lost server is useless, wait for the chunk being decoded to be done
+        with self.__lock:
+            device.chunks.clear()
+        while True:
+            with self.__lock:
+                if not device.decoding:
+                    break
+            time.sleep(0.001)
+        if not device.client.recover():
+            return
+        with self.__lock:
+            if self.__devices.get(self.key(device.client)) is not device:
+                # Removed meanwhile
+                return
+            self.__registrations.append(device)
+        self.__wakeup_w.send(b"\x00")
+
+    def __update_registrations(self) -> None:
+        with self.__lock:
+            registrations = list(self.__registrations)
+            removals = list(self.__removals)
+            self.__registrations.clear()
+            self.__removals.clear()
+        for device in removals:
+            self.__unregister(device)
+            device.client.stop()
+        # Clients stopped directly by the user
+        for device in list(self.__registered):
+            if not device.client.alive:
+                self.__unregister(device)
+        for device in registrations:
+            client = device.client
+            if not client.alive:
+                continue
+            self.__selector.register(client.video_socket, selectors.EVENT_READ, (device, True))
+            self.__selector.register(client.control_socket, selectors.EVENT_READ, (device, False))
+            self.__registered.add(device)
+
+    def __unregister(self, device: _FleetDevice) -> None:
+        if device not in self.__registered:
+            return
+        self.__registered.discard(device)
+        for sock in (device.client.video_socket, device.client.control_socket):
+            try:
+                self.__selector.unregister(sock)
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def __queue_video(self, device: _FleetDevice, data: bytes) -> None:
+        with self.__lock:
+            device.chunks.append(data)
+            if device.decoding:
+                return
+            device.decoding = True
+        self.__pool.submit(self.__decode, device)
+
+    def __decode(self, device: _FleetDevice) -> None:
+        while True:
+            with self.__lock:
+                if not device.chunks:
+                    device.decoding = False
+                    return
+                chunks: List[bytes] = list(device.chunks)
+                device.chunks.clear()
+            try:
+                device.client.feed(b"".join(chunks))
+            except InvalidDataError:
+                pass
+            except Exception as e:
+                device.error = repr(e)
@@ -0,0 +1,133 @@
+"""
+Pointer tracks for multi-touch gestures, played by ControlSender.gesture
+"""
+
+import math
+from typing import Callable, List, Sequence, Tuple
+
+Point = Tuple[float, float]
+
+
+class PointerTrack:
+    def __init__(self, path: Callable[[float], Point], touch_id: int):
+        """
+        A single finger moving along a path during a gesture
+
+        Args:
+            path: function mapping gesture progress t in [0, 1] to a screen position
+            touch_id: pointer id, must be unique among the tracks of one gesture
+        """
+        self.path = path
+        self.touch_id = touch_id
+
+    def position(self, t: float) -> Tuple[int, int]:
+        """
+        Position of the pointer at progress t
+
+        Args:
+            t: gesture progress, clamped to [0, 1]
+        """
+        x, y = self.path(min(max(t, 0.0), 1.0))
+        return int(round(x)), int(round(y))
+
+
+def line_track(start: Point, end: Point, touch_id: int) -> PointerTrack:
+    """
+    Track moving in a straight line from start to end
+
+    Args:
+        start: start position
+        end: end position
+        touch_id: pointer id
+    """
+    (x0, y0), (x1, y1) = start, end
+    return PointerTrack(lambda t: (x0 + (x1 - x0) * t, y0 + (y1 - y0) * t), touch_id)
+
+
+def arc_track(
+    center: Point,
+    start_radius: float,
+    end_radius: float,
+    start_angle: float,
+    end_angle: float,
+    touch_id: int,
+) -> PointerTrack:
+    """
+    Track moving around a center, interpolating both radius and angle
+
+    Args:
+        center: center position
+        start_radius: distance to center at t=0
+        end_radius: distance to center at t=1
+        start_angle: angle in degrees at t=0
+        end_angle: angle in degrees at t=1
+        touch_id: pointer id
+    """
+    cx, cy = center
+
+    def path(t: float) -> Point:
+        radius = start_radius + (end_radius - start_radius) * t
+        angle = math.radians(start_angle + (end_angle - start_angle) * t)
+        return cx + radius * math.cos(angle), cy + radius * math.sin(angle)
+
+    return PointerTrack(path, touch_id)
+
+
+def pinch_tracks(
+    center: Point,
+    start_distance: float,
+    end_distance: float,
+    angle: float = 0,
+    fingers: int = 2,
+) -> List[PointerTrack]:
+    """
+    Fingers spread evenly around a center moving closer (pinch) or apart (zoom)
+
+    Args:
+        center: gesture center
+        start_distance: distance between opposite fingers at start
+        end_distance: distance between opposite fingers at end
+        angle: angle in degrees of the first finger
+        fingers: number of fingers
+    """
+    assert fingers >= 2, "fingers must be greater than or equal to 2"
+    return [
+        arc_track(center, start_distance / 2, end_distance / 2, angle + i * 360 / fingers, angle + i * 360 / fingers, i)
+        for i in range(fingers)
+    ]
+
+
+def rotate_tracks(
+    center: Point,
+    radius: float,
+    degrees: float,
+    angle: float = 0,
+    fingers: int = 2,
+) -> List[PointerTrack]:
+    """
+    Fingers spread evenly on a circle rotating around its center
+
+    Args:
+        center: gesture center
+        radius: distance between each finger and the center
+        degrees: rotation, positive is clockwise on screen
+        angle: angle in degrees of the first finger
+        fingers: number of fingers
+    """
+    assert fingers >= 2, "fingers must be greater than or equal to 2"
+    return [
+        arc_track(center, radius, radius, angle + i * 360 / fingers, angle + i * 360 / fingers + degrees, i)
+        for i in range(fingers)
+    ]
+
+
+def swipe_tracks(starts: Sequence[Point], ends: Sequence[Point]) -> List[PointerTrack]:
+    """
+    Several fingers each swiping in a straight line
+
+    Args:
+        starts: start position of each finger
+        ends: end position of each finger
+    """
+    assert len(starts) == len(ends), "starts and ends must have the same length"
+    return [line_track(start, end, i) for i, (start, end) in enumerate(zip(starts, ends))]
@@ -0,0 +1,202 @@
+"""
+Measure input to photon latency: from sending an input to the first decoded frame showing its effect
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .control import ControlSender
+
+
+class LatencyStats(NamedTuple):
+    """
+    Distribution of the latencies of a probe, in seconds, None without any change seen
+    """
+
+    trials: int
+    misses: int  # trials without change before the timeout
+    mean: Optional[float]
+    p50: Optional[float]
+    p90: Optional[float]
+    p99: Optional[float]
+    max: Optional[float]
+
+    @classmethod
+    def from_samples(cls, samples: Sequence[Optional[float]]) -> "LatencyStats":
+        """
+        Args:
+            samples: latency of each trial, None for a miss
+        """
+        latencies = np.array([sample for sample in samples if sample is not None], dtype=np.float64)
+        if not len(latencies):
+            return cls(len(samples), len(samples), None, None, None, None, None)
+        p50, p90, p99 = (float(p) for p in np.percentile(latencies, [50, 90, 99]))
+        return cls(len(samples), len(samples) - len(latencies), float(latencies.mean()), p50, p90, p99, float(latencies.max()))
+
+    def report(self) -> str:
+        """
+        Human readable summary, in milliseconds
+        """
+        if self.mean is None:
+            return f"{self.trials} trials, no change seen"
+        return (
+            f"{self.trials} trials, {self.misses} missed: mean {self.mean * 1000:.1f} ms, p50 {self.p50 * 1000:.1f} ms, "
+            f"p90 {self.p90 * 1000:.1f} ms, p99 {self.p99 * 1000:.1f} ms, max {self.max * 1000:.1f} ms"
+        )
+
+
+class LatencyProbe:
+    def __init__(
+        self,
+        client,
+        action: Callable[[ControlSender], Any],
+        roi: Optional[Tuple[int, int, int, int]] = None,
+        threshold: float = 10.0,
+        timeout: float = 2.0,
+        settle: float = 0.5,
+    ):
+        """
+        Send a known input and time the first frame whose region of interest changes
+
+        The input must visibly change the region every time, e.g. tapping a toggle or a keycode
+        opening a panel and the next one closing it: each trial compares frames to the last frame
+        before its input. The latency covers sending, the device reaction, encoding, transport and
+        decoding, frame listeners registered before the probe included.
+
+        Args:
+            client: a started Client
+            action: sends the input, e.g. lambda control: control.keycode(KEYCODE_NOTIFICATION)
+            roi: width, height, x, y of the watched area, in frame pixels, None watches the whole frame
+            threshold: mean absolute difference of the region, in 0-255 levels, above which it changed
+            timeout: seconds to wait for a change before counting a miss
+            settle: seconds to wait before each trial, so the previous change is over
+        """
+        assert threshold > 0, "threshold must be greater than 0"
+        assert timeout > 0, "timeout must be greater than 0"
+        assert settle >= 0, "settle must be greater than or equal to 0"
+        self.client = client
+        self.action = action
+        self.roi = roi
+        self.threshold = threshold
+        self.timeout = timeout
+        self.settle = settle
+        self.samples: List[Optional[float]] = []
+
+    def region(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Watched area of a frame, a view
+
+        Args:
+            frame: decoded frame
+        """
+        if self.roi is None:
+            return frame
+        width, height, x, y = self.roi
+        return frame[y : y + height, x : x + width]
+
+    def difference(self, reference: np.ndarray, frame: np.ndarray) -> float:
+        """
+        Mean absolute difference between a reference region and the region of a frame
+
+        Args:
+            reference: region of the reference frame, as int16
+            frame: decoded frame
+        """
+        region = self.region(frame)
+        if region.shape != reference.shape:
+            # The resolution changed, e.g. on rotation
+            return float("inf")
+        return float(np.abs(region.astype(np.int16) - reference).mean())
+
+    def trial(self) -> Optional[float]:
+        """
+        Send the input once and wait for its effect
+
+        Returns:
+            Seconds from sending the input to the first changed frame, None on timeout
+        """
+        frame, _ = self.client.frame_state()
+        assert frame is not None, "the client has not decoded any frame yet"
+        reference = self.region(frame).astype(np.int16)
+        sent_at: Optional[float] = None
+        changed_at: Optional[float] = None
+        changed = threading.Event()
+
+        def on_frame(frame: Optional[np.ndarray]) -> None:
+            nonlocal changed_at
+            if frame is None or sent_at is None or changed.is_set():
+                return
+            if self.difference(reference, frame) > self.threshold:
+                changed_at = time.perf_counter()
+                changed.set()
+
+        self.client.add_listener("frame", on_frame)
+        try:
+            sent_at = time.perf_counter()
+            self.action(self.client.control)
+            changed.wait(self.timeout)
+        finally:
+            self.client.remove_listener("frame", on_frame)
+        latency = changed_at - sent_at if changed_at is not None else None
+        self.samples.append(latency)
+        return latency
+
+    def run(self, trials: int = 20) -> LatencyStats:
+        """
+        Run several trials
+
+        Args:
+            trials: number of inputs to send
+
+        Returns:
+            Distribution of the latencies of these trials
+        """
+        assert trials > 0, "trials must be greater than 0"
+        samples = []
+        for _ in range(trials):
+            time.sleep(self.settle)
+            samples.append(self.trial())
+        return LatencyStats.from_samples(samples)
+
+
+def measure_clients(
+    clients: Sequence,
+    action: Callable[[ControlSender], Any],
+    trials: int = 20,
+    **probe_options,
+) -> List[Tuple[Any, LatencyStats]]:
+    """
+    Probe several started clients, one thread per device
+
+    Clients of the same device are probed one after another, an input sent through one of them
+    would change the frames of the others.
+
+    Args:
+        clients: started clients
+        action: input sent to each client, see LatencyProbe
+        trials: number of inputs sent to each client
+        probe_options: other LatencyProbe arguments
+
+    Returns:
+        Client and latencies pairs, in the order of clients
+    """
+    probes = [LatencyProbe(client, action, **probe_options) for client in clients]
+    devices: Dict[Optional[str], List[LatencyProbe]] = {}
+    for probe in probes:
+        devices.setdefault(probe.client.transport.serial, []).append(probe)
+
+    def run_device(probes: List[LatencyProbe]) -> List[LatencyStats]:
+        return [probe.run(trials) for probe in probes]
+
+    with ThreadPoolExecutor(max_workers=max(1, len(devices))) as executor:
+        results = list(executor.map(run_device, devices.values()))
+    stats = {
+        id(probe): probe_stats
+        for device_probes, device_results in zip(devices.values(), results)
+        for probe, probe_stats in zip(device_probes, device_results)
+    }
+    return [(probe.client, stats[id(probe)]) for probe in probes]
@@ -0,0 +1,186 @@
+"""
+Video options of the bundled scrcpy server
+"""
+
+import re
+from typing import Dict, List, Literal, Optional, Tuple, Union
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+
+from .const import LOCK_SCREEN_ORIENTATION_INITIAL, LOCK_SCREEN_ORIENTATION_UNLOCKED
+
+SERVER_VERSION = "3.3.1"
+
+# Server version which introduced each option, or its current name
+OPTION_VERSIONS: Dict[str, Tuple[int, ...]] = {
+    "max_size": (1, 0),
+    "max_fps": (1, 0),
+    "crop": (1, 0),
+    "display_id": (1, 13),
+    "show_touches": (1, 13),
+    "stay_awake": (1, 14),
+    "power_off_on_close": (1, 18),
+    "video_bit_rate": (2, 0),
+    "video_codec": (2, 0),
+    "video_encoder": (2, 0),
+    "video_codec_options": (2, 0),
+    "video_source": (2, 2),
+    "capture_orientation": (3, 0),
+    "new_display": (3, 0),
+}
+
+# Names of the PyAV decoders for the server codecs
+DECODER_NAMES = {"h264": "h264", "h265": "hevc", "av1": "av1"}
+
+CAPTURE_ORIENTATION_PATTERN = re.compile(r"^@$|^@?(flip)?(0|90|180|270)$")
+NEW_DISPLAY_PATTERN = re.compile(r"^([1-9]\d*x[1-9]\d*)?(/[1-9]\d*)?$")
+
+
+def _parse_version(version: str) -> Tuple[int, ...]:
+    return tuple(int(part) for part in version.split("."))
+
+
+def capture_orientation_from_lock(lock_screen_orientation: int) -> Optional[str]:
+    """
+    Capture orientation equivalent to a LOCK_SCREEN_ORIENTATION_* value
+
+    Orientations 1 and 3 are a quarter turn counterclockwise and clockwise.
+
+    Args:
+        lock_screen_orientation: LOCK_SCREEN_ORIENTATION_*
+
+    Returns:
+        Locked capture orientation, None if unlocked
+    """
+    if lock_screen_orientation == LOCK_SCREEN_ORIENTATION_UNLOCKED:
+        return None
+    if lock_screen_orientation == LOCK_SCREEN_ORIENTATION_INITIAL:
+        return "@"
+    return f"@{(360 - lock_screen_orientation * 90) % 360}"
+
+
+class ServerOptions(BaseModel):
+    """
+    Video options passed to the server, validated against the bundled server version
+    """
+
+    model_config = ConfigDict(extra="forbid")
+
+    # Maximum width and height, 0 keeps the device resolution
+    max_size: int = Field(0, ge=0)
+    # 0 does not limit the frame rate (supported after android 10)
+    max_fps: float = Field(0, ge=0)
+    video_bit_rate: int = Field(8000000, gt=0)
+    video_codec: Literal["h264", "h265", "av1"] = "h264"
+    # None lets the device choose
+    video_encoder: Optional[str] = None
+    # MediaFormat keys, e.g. {"i-frame-interval": 1, "latency": 0}, typed from the python values
+    video_codec_options: Dict[str, Union[int, float, str]] = Field(default_factory=dict)
+    # width, height, x, y of the captured area, in device pixels
+    crop: Optional[Tuple[int, int, int, int]] = None
+    display_id: int = Field(0, ge=0)
+    # Stream a new virtual display instead: [WIDTHxHEIGHT][/DPI], "" for the main display size and density
+    new_display: Optional[str] = None
+    video_source: Literal["display", "camera"] = "display"
+    # [@][flip]0|90|180|270, @ locks it, a lone @ locks the initial orientation
+    capture_orientation: Optional[str] = None
+    stay_awake: bool = False
+    show_touches: bool = False
+    power_off_on_close: bool = False
+
+    @field_validator("video_codec_options")
+    @classmethod
+    def check_video_codec_options(cls, options: Dict[str, Union[int, float, str]]):
+        for key, value in options.items():
+            if not key or any(c in key for c in ",=:"):
+                raise ValueError(f"Invalid codec option key: {key!r}")
+            if isinstance(value, str) and "," in value:
+                raise ValueError(f"Codec option {key} value must not contain ','")
+        return options
+
+    @field_validator("crop")
+    @classmethod
+    def check_crop(cls, crop: Optional[Tuple[int, int, int, int]]):
+        if crop is not None:
+            width, height, x, y = crop
+            if width <= 0 or height <= 0 or x < 0 or y < 0:
+                raise ValueError("crop must be a positive size at a non-negative offset")
+        return crop
+
+    @field_validator("capture_orientation")
+    @classmethod
+    def check_capture_orientation(cls, orientation: Optional[str]):
+        if orientation is not None and not CAPTURE_ORIENTATION_PATTERN.match(orientation):
+            raise ValueError(f"Invalid capture orientation: {orientation!r}")
+        return orientation
+
+    @field_validator("new_display")
+    @classmethod
+    def check_new_display(cls, new_display: Optional[str]):
+        if new_display is not None and not NEW_DISPLAY_PATTERN.match(new_display):
+            raise ValueError(f"Invalid new display: {new_display!r}, expected [WIDTHxHEIGHT][/DPI]")
+        return new_display
+
+    @model_validator(mode="after")
+    def check_server_support(self):
+        if self.video_source == "camera" and (self.crop is not None or self.display_id or self.new_display is not None):
+            raise ValueError("crop, display_id and new_display only apply to the display video source")
+        if self.display_id and self.new_display is not None:
+            raise ValueError("display_id and new_display are exclusive")
+        server_version = _parse_version(SERVER_VERSION)
+        for name in self.model_fields_set:
+            if name in OPTION_VERSIONS and OPTION_VERSIONS[name] > server_version:
+                raise ValueError(f"{name} is not supported by server {SERVER_VERSION}")
+        return self
+
+    @property
+    def decoder_name(self) -> str:
+        """
+        PyAV decoder of the video codec
+        """
+        return DECODER_NAMES[self.video_codec]
+
+    def codec_options_arg(self) -> str:
+        """
+        video_codec_options in the server format: key[:type]=value,...
+        """
+        items = []
+        for key, value in self.video_codec_options.items():
+            if isinstance(value, bool) or isinstance(value, int):
+                items.append(f"{key}={int(value)}")
+            elif isinstance(value, float):
+                items.append(f"{key}:float={value}")
+            else:
+                items.append(f"{key}:string={value}")
+        return ",".join(items)
+
+    def to_args(self) -> List[str]:
+        """
+        Server arguments for these options
+        """
+        args = [
+            f"max_size={self.max_size}",
+            f"max_fps={self.max_fps:g}",
+            f"video_bit_rate={self.video_bit_rate}",
+            f"video_codec={self.video_codec}",
+        ]
+        if self.video_encoder:
+            args.append(f"video_encoder={self.video_encoder}")
+        if self.video_codec_options:
+            args.append(f"video_codec_options={self.codec_options_arg()}")
+        if self.video_source != "display":
+            args.append(f"video_source={self.video_source}")
+        if self.crop is not None:
+            args.append("crop={}:{}:{}:{}".format(*self.crop))
+        if self.display_id:
+            args.append(f"display_id={self.display_id}")
+        if self.new_display is not None:
+            args.append(f"new_display={self.new_display}")
+        if self.capture_orientation is not None:
+            args.append(f"capture_orientation={self.capture_orientation}")
+        args += [
+            f"stay_awake={str(self.stay_awake).lower()}",
+            f"show_touches={str(self.show_touches).lower()}",
+            f"power_off_on_close={str(self.power_off_on_close).lower()}",
+        ]
+        return args
@@ -0,0 +1,57 @@
+"""
+When and how often a client reconnects after losing its device
+"""
+
+import random
+from typing import Iterator, Optional
+
+
+class ReconnectPolicy:
+    def __init__(
+        self,
+        max_attempts: Optional[int] = 10,
+        initial_delay: float = 0.1,
+        max_delay: float = 5.0,
+        multiplier: float = 2.0,
+        jitter: float = 0.5,
+    ):
+        """
+        Exponential backoff with jitter between reconnection attempts
+
+        Jitter spreads the attempts of devices dropped together, e.g. by a USB hub reset.
+
+        Args:
+            max_attempts: attempts before giving up, None retries forever
+            initial_delay: delay before the first attempt, in seconds
+            max_delay: upper bound of the delay, in seconds
+            multiplier: growth of the delay after each failed attempt
+            jitter: fraction of the delay which is randomized, 0 disables it
+        """
+        assert max_attempts is None or max_attempts > 0, "max_attempts must be greater than 0"
+        assert 0 <= initial_delay <= max_delay, "initial_delay must be between 0 and max_delay"
+        assert multiplier >= 1, "multiplier must be greater than or equal to 1"
+        assert 0 <= jitter <= 1, "jitter must be between 0 and 1"
+        self.max_attempts = max_attempts
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    def delay(self, attempt: int) -> float:
+        """
+        Delay before an attempt
+
+        Args:
+            attempt: attempt number, starting at 0
+        """
+        delay = min(self.max_delay, self.initial_delay * self.multiplier**attempt)
+        return delay * random.uniform(1 - self.jitter, 1)
+
+    def delays(self) -> Iterator[float]:
+        """
+        Delays before each attempt, until max_attempts
+        """
+        attempt = 0
+        while self.max_attempts is None or attempt < self.max_attempts:
+            yield self.delay(attempt)
+            attempt += 1
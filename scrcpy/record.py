@@ -0,0 +1,190 @@
+"""
+Record control messages to a binary log and replay them with precise timing
+
+File layout: an 8 byte magic and a 2 byte version, followed by one record per message,
+each record is a big-endian (uint64 nanoseconds since recording start, uint32 length)
+header and the raw message bytes, exactly as sent on the control socket. Touch and scroll
+messages hold the frame size they were recorded on, replays rescale them to each device.
+"""
+
+import struct
+import threading
+import time
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Tuple, Union
+
+from . import const
+from .control import ControlSender
+from .timing import sleep_until
+
+MAGIC = b"SCRCPYIN"
+VERSION = 1
+FILE_HEADER = struct.Struct(">8sH")
+RECORD_HEADER = struct.Struct(">QI")
+# Position of touch and scroll messages: x, y, frame width, frame height, and its offset in each one
+POSITION = struct.Struct(">iiHH")
+POSITION_OFFSETS = {const.TYPE_INJECT_TOUCH_EVENT: 10, const.TYPE_INJECT_SCROLL_EVENT: 1}
+
+
+def rescale_position(package: bytes, resolution: Optional[Tuple[int, int]]) -> bytes:
+    """
+    Move the position of a touch or scroll message to another frame size
+
+    The server drops the touch and scroll events whose frame size is not the one it streams.
+
+    Args:
+        package: serialized control message
+        resolution: width and height of the target's frames, None leaves the message as is
+
+    Returns:
+        The message for that frame size, other messages unchanged
+    """
+    offset = POSITION_OFFSETS.get(package[0]) if package else None
+    if offset is None or resolution is None or len(package) < offset + POSITION.size:
+        return package
+    x, y, width, height = POSITION.unpack_from(package, offset)
+    target_width, target_height = (int(size) for size in resolution)
+    if (width, height) == (target_width, target_height) or not width or not height:
+        return package
+    position = POSITION.pack(x * target_width // width, y * target_height // height, target_width, target_height)
+    return package[:offset] + position + package[offset + POSITION.size :]
+
+
+class InputRecorder:
+    def __init__(self, control: ControlSender, file: Union[str, BinaryIO]):
+        """
+        Record every message sent through a ControlSender
+
+        Args:
+            control: control sender to record
+            file: path or binary file object to write the log to
+        """
+        self.control = control
+        self.__own_file = isinstance(file, str)
+        self.__file: BinaryIO = open(file, "wb") if self.__own_file else file
+        self.__lock = threading.Lock()
+        self.__start: Optional[int] = None
+        self.count = 0
+
+    def start(self) -> "InputRecorder":
+        """
+        Write the file header and start recording
+        """
+        assert self.__start is None, "recorder already started"
+        self.__file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self.__start = time.monotonic_ns()
+        self.control.add_listener(self)
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop recording and flush the log
+        """
+        self.control.remove_listener(self)
+        with self.__lock:
+            self.__file.flush()
+            if self.__own_file:
+                self.__file.close()
+
+    def __call__(self, package: bytes) -> None:
+        offset = time.monotonic_ns() - self.__start
+        with self.__lock:
+            self.__file.write(RECORD_HEADER.pack(offset, len(package)) + package)
+            self.count += 1
+
+    def __enter__(self) -> "InputRecorder":
+        return self.start()
+
+    def __exit__(self, *_) -> None:
+        self.stop()
+
+
+def read_recording(file: Union[str, BinaryIO]) -> Iterator[Tuple[int, bytes]]:
+    """
+    Read a log written by InputRecorder
+
+    Args:
+        file: path or binary file object
+
+    Returns:
+        (nanoseconds since recording start, message) pairs
+    """
+    f = open(file, "rb") if isinstance(file, str) else file
+    try:
+        magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a scrcpy input recording")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if not header:
+                break
+            offset, length = RECORD_HEADER.unpack(header)
+            package = f.read(length)
+            if len(package) != length:
+                raise ValueError("Truncated scrcpy input recording")
+            yield offset, package
+    finally:
+        if isinstance(file, str):
+            f.close()
+
+
+class InputReplayer:
+    def __init__(self, file: Union[str, BinaryIO]):
+        """
+        Replay a log written by InputRecorder
+
+        Args:
+            file: path or binary file object
+        """
+        self.events: List[Tuple[int, bytes]] = list(read_recording(file))
+
+    def play(self, controls: Union[ControlSender, Sequence[ControlSender]], speed: float = 1.0) -> None:
+        """
+        Send the recorded messages with their original timing
+
+        With several control senders, each device gets its own sender thread following the same
+        schedule, so a slow write to one device does not delay the others. Touch and scroll
+        positions are scaled to the current frame size of each device.
+
+        Args:
+            controls: control sender, or control senders of several devices
+            speed: playback speed factor, 2 plays twice as fast
+        """
+        assert speed > 0, "speed must be greater than 0"
+        if isinstance(controls, ControlSender):
+            controls = [controls]
+
+        start = time.perf_counter()
+        if len(controls) == 1:
+            self.__play_one(controls[0], start, speed)
+            return
+        errors: List[BaseException] = []
+        threads = [
+            threading.Thread(target=self.__play_one, args=(control, start, speed, errors), daemon=True) for control in controls
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def __play_one(
+        self, control: ControlSender, start: float, speed: float, errors: Optional[List[BaseException]] = None
+    ) -> None:
+        """
+        Send the messages to one device
+
+        Args:
+            control: control sender of the device
+            start: time.perf_counter() value of the recording start
+            speed: playback speed factor
+            errors: collects the exception of a failed send instead of raising it
+        """
+        try:
+            for offset, package in self.events:
+                sleep_until(start + offset / 1e9 / speed)
+                control.send(rescale_position(package, control.parent.resolution))
+        except Exception as e:
+            if errors is None:
+                raise
+            errors.append(e)
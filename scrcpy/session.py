@@ -0,0 +1,122 @@
+"""
+Server sessions kept running between clients, to switch devices without restarting their server
+"""
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .device_message import DeviceMessageReader
+
+SessionKey = Tuple[Optional[str], Tuple[str, ...]]
+
+
+class ServerSession:
+    def __init__(
+        self,
+        key: SessionKey,
+        server_stream,
+        video_socket,
+        control_socket,
+        device_message_reader: Optional[DeviceMessageReader],
+        device_name: str,
+        resolution: Optional[Tuple[int, int]] = None,
+        scid: Optional[int] = None,
+    ):
+        """
+        A running server with its connected sockets, which can outlive the client that started it
+
+        Args:
+            key: device serial and server arguments, a client attaches only with the same key
+            server_stream: adb shell stream running the server
+            video_socket: connected video socket
+            control_socket: connected control socket
+            device_message_reader: reader of the control socket, handed over to the next client
+            device_name: device name sent during the handshake
+            resolution: last known video resolution
+            scid: id the server was started with
+        """
+        self.key = key
+        self.server_stream = server_stream
+        self.video_socket = video_socket
+        self.control_socket = control_socket
+        self.device_message_reader = device_message_reader
+        self.device_name = device_name
+        self.resolution = resolution
+        self.scid = scid
+
+    @property
+    def alive(self) -> bool:
+        """
+        Whether the sockets are still open, and the control socket still read
+        """
+        if self.video_socket.fileno() == -1 or self.control_socket.fileno() == -1:
+            return False
+        return self.device_message_reader is None or self.device_message_reader.thread.is_alive()
+
+    def close(self) -> None:
+        """
+        Stop the server and close the sockets
+        """
+        for resource in (self.server_stream, self.control_socket, self.video_socket):
+            try:
+                resource.close()
+            except Exception:
+                pass
+
+
+_sessions: Dict[SessionKey, List[ServerSession]] = {}
+_sessions_lock = threading.Lock()
+
+
+def park(session: ServerSession) -> None:
+    """
+    Keep a session for a later client, device messages are dropped until one attaches
+
+    Args:
+        session: session released by a client
+    """
+    if session.device_message_reader is not None:
+        session.device_message_reader.on_message = lambda _: None
+        session.device_message_reader.on_close = None
+    with _sessions_lock:
+        _sessions.setdefault(session.key, []).append(session)
+
+
+def take(key: SessionKey) -> Optional[ServerSession]:
+    """
+    Remove and return a live parked session, dead ones found on the way are closed
+
+    Args:
+        key: device serial and server arguments
+    """
+    while True:
+        with _sessions_lock:
+            sessions = _sessions.get(key)
+            if not sessions:
+                return None
+            session = sessions.pop()
+        if session.alive:
+            return session
+        session.close()
+
+
+def parked_sessions() -> List[ServerSession]:
+    """
+    All parked sessions
+    """
+    with _sessions_lock:
+        return [session for sessions in _sessions.values() for session in sessions]
+
+
+def close_sessions(serial: Optional[str] = None) -> None:
+    """
+    Stop parked sessions
+
+    Args:
+        serial: only the sessions of this device, all if None
+    """
+    with _sessions_lock:
+        keys = [key for key in _sessions if serial is None or key[0] == serial]
+        sessions = [session for key in keys for session in _sessions.pop(key)]
+    for session in sessions:
+        session.close()
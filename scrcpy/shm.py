@@ -0,0 +1,305 @@
+"""
+Ring of decoded frames in shared memory, written by one process and read by any number of others
+
+Layout: a ring header, then one header per slot, then the slot data.
+A slot's seq is set to 0 while it is written, so readers can tell whether a frame is
+complete and whether it has been overwritten since they got a view on it.
+"""
+
+import struct
+import time
+from multiprocessing import shared_memory
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+MAGIC = b"SCFR"
+VERSION = 1
+# magic, version, slots, flags, slot_size, latest seq
+RING_HEADER = struct.Struct("<4sIIIQQ")
+FLAG_CLOSED = 1
+# seq, pts, height, width, channels, format
+SLOT_HEADER = struct.Struct("<QqIIII")
+HEADER_ALIGN = 64
+
+# Pixel formats
+FORMAT_BGR24 = 0
+FORMAT_RGB24 = 1
+FORMAT_GRAY8 = 2
+FORMAT_NAMES = {FORMAT_BGR24: "bgr24", FORMAT_RGB24: "rgb24", FORMAT_GRAY8: "gray"}
+
+
+def _aligned(size: int) -> int:
+    return (size + HEADER_ALIGN - 1) // HEADER_ALIGN * HEADER_ALIGN
+
+
+class RingFrame(NamedTuple):
+    seq: int
+    pts: int
+    format: int
+    frame: np.ndarray
+
+
+class FrameRing:
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        """
+        Use FrameRing.create or FrameRing.attach
+        """
+        self.shm = shm
+        self.owner = owner
+        magic, version, self.slots, _, self.slot_size, _ = RING_HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            shm.close()
+            raise ValueError(f"Shared memory {shm.name} is not a frame ring")
+        self.__slot_headers = _aligned(RING_HEADER.size)
+        self.__data = self.__slot_headers + _aligned(SLOT_HEADER.size * self.slots)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @classmethod
+    def create(cls, slots: int, slot_size: int, name: Optional[str] = None, latest: int = 0) -> "FrameRing":
+        """
+        Create a ring, the creating process is its only writer
+
+        Args:
+            slots: number of frames kept, readers lagging more than slots frames lose them
+            slot_size: maximum frame size in bytes
+            name: shared memory name, random if None
+            latest: sequence number the ring starts after, to continue the one of a replaced ring
+        """
+        assert slots > 0, "slots must be greater than 0"
+        assert latest >= 0, "latest must be greater than or equal to 0"
+        size = _aligned(RING_HEADER.size) + _aligned(SLOT_HEADER.size * slots) + slots * _aligned(slot_size)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        RING_HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, slots, 0, _aligned(slot_size), latest)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "FrameRing":
+        """
+        Attach to a ring created by another process
+
+        Args:
+            name: shared memory name
+        """
+        return cls(shared_memory.SharedMemory(name=name, track=False), owner=False)
+
+    @property
+    def latest(self) -> int:
+        """
+        Sequence number of the last complete frame, 0 if none
+        """
+        return RING_HEADER.unpack_from(self.shm.buf, 0)[5]
+
+    @property
+    def closed(self) -> bool:
+        """
+        Whether the writer has released the ring, readers should attach to its replacement
+        """
+        return bool(RING_HEADER.unpack_from(self.shm.buf, 0)[3] & FLAG_CLOSED)
+
+    def write(self, frame: np.ndarray, pts: int = 0, format: int = FORMAT_BGR24) -> int:
+        """
+        Copy a frame into the next slot
+
+        Args:
+            frame: HxW or HxWxC uint8 array
+            pts: presentation timestamp stored with the frame
+            format: FORMAT_*
+
+        Returns:
+            Sequence number of the frame, starting at 1
+        """
+        if frame.nbytes > self.slot_size:
+            raise ValueError(f"Frame of {frame.nbytes} bytes exceeds slot size {self.slot_size}")
+        seq = self.latest + 1
+        header = self.__slot_headers + (seq % self.slots) * SLOT_HEADER.size
+        data = self.__data + (seq % self.slots) * self.slot_size
+
+        struct.pack_into("<Q", self.shm.buf, header, 0)
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        np.ndarray(frame.shape, np.uint8, self.shm.buf, data)[...] = frame
+        SLOT_HEADER.pack_into(self.shm.buf, header, seq, pts, height, width, channels, format)
+        struct.pack_into("<Q", self.shm.buf, RING_HEADER.size - 8, seq)
+        return seq
+
+    def read(self, seq: Optional[int] = None) -> Optional[RingFrame]:
+        """
+        Get a zero-copy view on a frame
+
+        The view is overwritten slots frames later, check is_valid(seq) after using it,
+        or copy it to keep it.
+
+        Args:
+            seq: sequence number, latest if None
+
+        Returns:
+            The frame, or None if it is not available (not written yet or overwritten)
+        """
+        if seq is None:
+            seq = self.latest
+        if seq <= 0:
+            return None
+        header = self.__slot_headers + (seq % self.slots) * SLOT_HEADER.size
+        slot_seq, pts, height, width, channels, format = SLOT_HEADER.unpack_from(self.shm.buf, header)
+        if slot_seq != seq:
+            return None
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        frame = np.ndarray(shape, np.uint8, self.shm.buf, self.__data + (seq % self.slots) * self.slot_size)
+        if not self.is_valid(seq):
+            return None
+        return RingFrame(seq, pts, format, frame)
+
+    def is_valid(self, seq: int) -> bool:
+        """
+        Whether the frame seq is still in its slot
+
+        Args:
+            seq: sequence number
+        """
+        header = self.__slot_headers + (seq % self.slots) * SLOT_HEADER.size
+        return struct.unpack_from("<Q", self.shm.buf, header)[0] == seq
+
+    def close(self) -> None:
+        """
+        Detach from the ring, and remove it if this process created it
+
+        Views returned by read must be released first.
+        """
+        if self.owner:
+            struct.pack_into("<I", self.shm.buf, 12, FLAG_CLOSED)
+        try:
+            self.shm.close()
+        except BufferError:
+            # Views still exported, the mapping is released when they are collected
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class FramePublisher:
+    def __init__(self, name: str, slots: int = 4, format: int = FORMAT_BGR24):
+        """
+        Publish frames to a named ring, for FrameSubscriber in other processes
+
+        Use it as a frame listener: client.add_listener(EVENT_FRAME, FramePublisher("phone1")).
+        The ring is created on the first frame, and recreated under the same name if a larger
+        frame arrives, e.g. on rotation, sequence numbers going on from the previous ring.
+        Each frame is stored with its time.monotonic_ns() as pts.
+
+        Args:
+            name: shared memory name
+            slots: frames kept in the ring
+            format: FORMAT_* of the published frames
+        """
+        self.name = name
+        self.slots = slots
+        self.format = format
+        self.ring: Optional[FrameRing] = None
+
+    def __call__(self, frame: Optional[np.ndarray]) -> None:
+        if frame is None:
+            return
+        self.publish(frame)
+
+    def publish(self, frame: np.ndarray, pts: Optional[int] = None) -> int:
+        """
+        Copy a frame into the ring
+
+        Args:
+            frame: HxW or HxWxC uint8 array
+            pts: timestamp stored with the frame, time.monotonic_ns() if None
+
+        Returns:
+            Sequence number of the frame
+        """
+        if self.ring is None or frame.nbytes > self.ring.slot_size:
+            # Subscribers wait for sequence numbers after the last one they saw
+            latest = self.ring.latest if self.ring is not None else 0
+            self.close()
+            self.ring = FrameRing.create(self.slots, frame.nbytes, self.name, latest)
+        return self.ring.write(frame, time.monotonic_ns() if pts is None else pts, self.format)
+
+    def close(self) -> None:
+        """
+        Remove the ring, subscribers keep their mapping until they detach
+        """
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+class FrameSubscriber:
+    def __init__(self, name: str):
+        """
+        Read the latest frames of a FramePublisher without copying them
+
+        Args:
+            name: shared memory name given to the publisher
+        """
+        self.name = name
+        self.ring: Optional[FrameRing] = None
+
+    def __ring(self) -> Optional[FrameRing]:
+        if self.ring is not None and self.ring.closed:
+            self.ring.close()
+            self.ring = None
+        if self.ring is None:
+            try:
+                self.ring = FrameRing.attach(self.name)
+            except (FileNotFoundError, ValueError):
+                return None
+        return self.ring
+
+    def latest(self) -> Optional[RingFrame]:
+        """
+        View on the latest frame, None if nothing is published yet
+
+        The view is overwritten once the ring wraps, check is_valid(seq) after using it.
+        """
+        ring = self.__ring()
+        return ring.read() if ring is not None else None
+
+    def wait(self, after: int = 0, timeout: Optional[float] = None, interval: float = 0.001) -> Optional[RingFrame]:
+        """
+        Wait for a frame newer than after
+
+        Args:
+            after: sequence number already seen
+            timeout: seconds to wait, None waits forever
+            interval: polling interval in seconds
+
+        Returns:
+            View on the latest frame, None on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            frame = self.latest()
+            if frame is not None and frame.seq > after:
+                return frame
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(interval)
+
+    def is_valid(self, seq: int) -> bool:
+        """
+        Whether the frame seq has not been overwritten yet
+
+        Args:
+            seq: sequence number
+        """
+        return self.ring is not None and not self.ring.closed and self.ring.is_valid(seq)
+
+    def close(self) -> None:
+        """
+        Detach from the ring
+        """
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
@@ -0,0 +1,101 @@
+"""
+Connect to the server with plain TCP sockets through an adb forward
+"""
+
+import socket
+from typing import Optional
+
+# Seconds between keepalive probes, and unanswered probes before the connection is dropped
+KEEPALIVE_INTERVAL = 1
+KEEPALIVE_COUNT = 5
+
+
+class TcpForward:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        nodelay: bool = True,
+        receive_buffer: Optional[int] = 4 * 1024 * 1024,
+        keepalive: Optional[float] = None,
+    ):
+        """
+        Reach the server socket through an `adb forward` instead of adb's own connections
+
+        The sockets are then ordinary TCP sockets to the adb server, whose options can be tuned:
+        control messages are small and latency bound, video is large and throughput bound.
+        The forward only lives while the sockets connect, connected sockets do not need it.
+
+        Args:
+            host: host of the adb server, which listens on the forwarded port
+            nodelay: disable Nagle's algorithm on the control socket, so inputs are sent at once
+            receive_buffer: SO_RCVBUF of the video socket in bytes, None keeps the system default
+            keepalive: seconds without traffic before keepalive probes, None disables keepalive
+        """
+        assert receive_buffer is None or receive_buffer > 0, "receive_buffer must be greater than 0"
+        assert keepalive is None or keepalive > 0, "keepalive must be greater than 0"
+        self.host = host
+        self.nodelay = nodelay
+        self.receive_buffer = receive_buffer
+        self.keepalive = keepalive
+
+    @staticmethod
+    def forward(device, name: str) -> int:
+        """
+        Forward a local port to an abstract socket of the device
+
+        Args:
+            device: AdbDevice
+            name: abstract socket name
+
+        Returns:
+            Local port
+        """
+        return device.forward_port(f"localabstract:{name}")
+
+    @staticmethod
+    def remove(device, port: int) -> None:
+        """
+        Remove a forward, sockets connected through it stay open
+
+        Args:
+            device: AdbDevice
+            port: local port returned by forward
+        """
+        device.forward_remove(f"tcp:{port}", raise_non_found=False)
+
+    def connect(self, port: int, video: bool) -> socket.socket:
+        """
+        Connect to a forwarded port
+
+        adb accepts the connection even if nothing listens on the device yet, it closes it then.
+
+        Args:
+            port: local port returned by forward
+            video: tune the socket for video rather than control messages
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            # The receive window is negotiated on connect, the buffer must be set before
+            if video and self.receive_buffer is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer)
+            if not video and self.nodelay:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.keepalive is not None:
+                self.__set_keepalive(sock)
+            sock.connect((self.host, port))
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def __set_keepalive(self, sock: socket.socket) -> None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        idle = max(1, int(self.keepalive))
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+        elif hasattr(socket, "TCP_KEEPALIVE"):  # macOS
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+        if hasattr(socket, "TCP_KEEPINTVL"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, KEEPALIVE_INTERVAL)
+        if hasattr(socket, "TCP_KEEPCNT"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, KEEPALIVE_COUNT)
@@ -0,0 +1,26 @@
+"""
+Precise scheduling helpers
+"""
+
+import time
+
+# Below this margin the OS scheduler is too coarse, so the remaining time is spun
+SPIN_MARGIN = 0.002
+
+
+def sleep_until(deadline: float, spin_margin: float = SPIN_MARGIN) -> None:
+    """
+    Wait until time.perf_counter() reaches deadline
+
+    Sleep while the deadline is far away, then spin for the last spin_margin seconds,
+    which keeps the wake-up error well under a millisecond.
+
+    Args:
+        deadline: target time.perf_counter() value
+        spin_margin: seconds before the deadline to switch from sleeping to spinning
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining > spin_margin:
+        time.sleep(remaining - spin_margin)
+    while time.perf_counter() < deadline:
+        pass
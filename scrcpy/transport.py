@@ -0,0 +1,350 @@
+"""
+How a client runs its server and reaches its sockets: adb, TCP through adb forward, or a recorded stream
+"""
+
+import abc
+import functools
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from adbutils import AdbDevice, Network
+from av.codec import CodecContext
+
+from .options import DECODER_NAMES
+from .tcp import TcpForward
+from .timing import sleep_until
+
+JAR_NAME = "scrcpy-server.jar"
+REMOTE_JAR_PATH = f"/data/local/tmp/{JAR_NAME}"
+
+
+def _cache_dir() -> str:
+    """
+    Per user cache directory of this package
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or (os.environ.get("LOCALAPPDATA") if os.name == "nt" else None)
+    return os.path.join(base or os.path.join(os.path.expanduser("~"), ".cache"), "scrcpy-client")
+
+
+# Jars known to be up to date, kept across processes: [[serial, jar sha256, size, mtime], ...]
+JAR_CACHE_PATH = os.path.join(_cache_dir(), "deployed_jars.json")
+
+# (device serial, jar sha256) -> (size, mtime) of the remote jar once known to be up to date, None until loaded
+_deployed_jars: Optional[Dict[Tuple[Optional[str], str], Tuple[int, str]]] = None
+_deployed_jars_lock = threading.Lock()
+
+
+def _jar_cache() -> Dict[Tuple[Optional[str], str], Tuple[int, str]]:
+    """
+    Deployed jars, loaded from JAR_CACHE_PATH on first use, call it under _deployed_jars_lock
+    """
+    global _deployed_jars
+    if _deployed_jars is None:
+        _deployed_jars = {}
+        try:
+            with open(JAR_CACHE_PATH, "r", encoding="utf-8") as f:
+                for serial, digest, size, mtime in json.load(f):
+                    _deployed_jars[(serial, digest)] = (size, mtime)
+        except (OSError, ValueError, TypeError):
+            # Missing or corrupted, jars are checked on the devices again
+            pass
+    return _deployed_jars
+
+
+def _remember_jar(key: Tuple[Optional[str], str], size: int, mtime: Any) -> None:
+    """
+    Record an up to date remote jar, and save the cache for the next processes
+
+    Devices without serial are only remembered by this process.
+    """
+    with _deployed_jars_lock:
+        cache = _jar_cache()
+        cache[key] = (size, str(mtime))
+        if key[0] is None:
+            return
+        entries = [[serial, digest, size, mtime] for (serial, digest), (size, mtime) in cache.items() if serial is not None]
+        try:
+            os.makedirs(os.path.dirname(JAR_CACHE_PATH), exist_ok=True)
+            temporary = f"{JAR_CACHE_PATH}.{os.getpid()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(temporary, JAR_CACHE_PATH)
+        except OSError:
+            # Read-only home, the cache then only lives in this process
+            pass
+
+
+@functools.cache
+def _server_jar() -> Tuple[str, int, str]:
+    """
+    Path, size and sha256 of the bundled server jar
+    """
+    path = os.path.join(os.path.abspath(os.path.dirname(__file__)), JAR_NAME)
+    with open(path, "rb") as f:
+        return path, os.path.getsize(path), hashlib.sha256(f.read()).hexdigest()
+
+
+class Transport(abc.ABC):
+    """
+    I/O between a client and its server
+
+    A client calls push_server and start_server, then open_socket for the video socket and the
+    control socket, and release once both are open or the connection failed. The sockets must
+    be real sockets, the client polls and selects them.
+
+    Subclasses implement start_server and open_socket, push_server and release do nothing by default.
+    """
+
+    device: Optional[AdbDevice] = None
+
+    @property
+    def serial(self) -> Optional[str]:
+        """
+        Serial of the device, None if there is no device
+        """
+        return getattr(self.device, "serial", None)
+
+    def push_server(self) -> None:
+        """
+        Make the server jar available to start_server
+        """
+
+    @abc.abstractmethod
+    def start_server(self, commands: List[str]):
+        """
+        Start a server
+
+        Args:
+            commands: command line of the server
+
+        Returns:
+            Stream of the server output, closing it stops the server
+        """
+
+    @abc.abstractmethod
+    def open_socket(self, name: str, video: bool) -> socket.socket:
+        """
+        Connect to the socket of a server
+
+        Args:
+            name: abstract socket name of the server
+            video: whether it is the video socket, opened first, or the control socket
+
+        Raises:
+            AdbError, ConnectionRefusedError: the server does not listen yet, the client retries
+        """
+
+    def release(self, name: str) -> None:
+        """
+        Free what open_socket needed, open sockets stay open
+
+        Args:
+            name: abstract socket name of the server
+        """
+
+
+class AdbTransport(Transport):
+    def __init__(self, device: AdbDevice):
+        """
+        Run the server with adb shell and connect through adb, the default
+
+        Args:
+            device: Android device
+        """
+        self.device = device
+
+    def push_server(self) -> None:
+        """
+        Push the server jar, unless the device already has this exact jar
+
+        The remote size and mtime are compared with what was last seen for the device and jar
+        hash, in JAR_CACHE_PATH, a jar not seen yet is checked with sha256sum on the device.
+        """
+        path, size, digest = _server_jar()
+        key = (self.serial, digest)
+        remote = self.device.sync.stat(REMOTE_JAR_PATH)
+        if remote.size == size:
+            with _deployed_jars_lock:
+                known = _jar_cache().get(key)
+            if known == (remote.size, str(remote.mtime)):
+                return
+            output = self.device.shell(["sha256sum", REMOTE_JAR_PATH])
+            if isinstance(output, str) and output.split(" ", 1)[0] == digest:
+                _remember_jar(key, remote.size, remote.mtime)
+                return
+
+        self.device.sync.push(path, REMOTE_JAR_PATH)
+        remote = self.device.sync.stat(REMOTE_JAR_PATH)
+        _remember_jar(key, remote.size, remote.mtime)
+
+    def start_server(self, commands: List[str]):
+        return self.device.shell(commands, stream=True)
+
+    def open_socket(self, name: str, video: bool) -> socket.socket:
+        return self.device.create_connection(Network.LOCAL_ABSTRACT, name)
+
+
+class TcpTransport(AdbTransport):
+    def __init__(self, device: AdbDevice, tcp: Optional[TcpForward] = None):
+        """
+        Run the server with adb shell and connect with plain TCP sockets through an adb forward
+
+        Args:
+            device: Android device
+            tcp: forward host and socket options, defaults to TcpForward()
+        """
+        super().__init__(device)
+        self.tcp = tcp if tcp is not None else TcpForward()
+        self.__ports: Dict[str, int] = {}
+        self.__lock = threading.Lock()
+
+    def open_socket(self, name: str, video: bool) -> socket.socket:
+        with self.__lock:
+            port = self.__ports.get(name)
+            if port is None:
+                port = self.__ports[name] = self.tcp.forward(self.device, name)
+        sock = self.tcp.connect(port, video)
+        if video:
+            # adb accepts forwarded connections before the server listens, then closes them
+            try:
+                peek = sock.recv(1, socket.MSG_PEEK)
+            except OSError:
+                peek = b""
+            if peek == b"":
+                sock.close()
+                raise ConnectionRefusedError(f"Server socket {name} is not listening")
+        return sock
+
+    def release(self, name: str) -> None:
+        with self.__lock:
+            port = self.__ports.pop(name, None)
+        if port is not None:
+            self.tcp.remove(self.device, port)
+
+
+class _ReplayServer:
+    """
+    Output of a server which is never started
+    """
+
+    def __init__(self, device_name: str):
+        self.__output = f"[server] INFO: Device: {device_name}\n".encode()
+
+    def recv(self, size: int) -> bytes:
+        if not self.__output:
+            raise BlockingIOError()
+        chunk, self.__output = self.__output[:size], self.__output[size:]
+        return chunk
+
+    def close(self) -> None:
+        pass
+
+
+class ReplayTransport(Transport):
+    def __init__(
+        self,
+        source: Union[str, os.PathLike, Iterable[bytes]],
+        resolution: Tuple[int, int] = (0, 0),
+        device_name: str = "replay",
+        chunk_size: int = 0x10000,
+        fps: Optional[float] = None,
+        codec_name: str = "h264",
+    ):
+        """
+        Play a recorded video stream as if a server sent it, without device
+
+        The stream is sent after the handshake of a server, as fast as the client reads it or
+        one frame every 1 / fps seconds, then the video socket is closed. Control messages are
+        read and discarded.
+
+        Args:
+            source: raw stream file of the client's codec, e.g. H.264 annex B,
+                or its chunks, e.g. those of tests/test_video_data.pkl
+            resolution: resolution sent in the handshake, replaced by the one of the first frame
+            device_name: device name sent in the handshake
+            chunk_size: bytes per write when source is a file
+            fps: rate the stream was recorded at, raw streams have no timestamps, None does not wait
+            codec_name: codec of the stream, to split it into frames with fps, enum: [h264, h265, av1]
+        """
+        assert chunk_size > 0, "chunk_size must be greater than 0"
+        assert fps is None or fps > 0, "fps must be greater than 0"
+        assert codec_name in DECODER_NAMES, "codec_name must be h264, h265 or av1"
+        self.source = source
+        self.resolution = resolution
+        self.device_name = device_name
+        self.chunk_size = chunk_size
+        self.fps = fps
+        self.codec_name = codec_name
+        self.threads: List[threading.Thread] = []
+
+    @property
+    def serial(self) -> Optional[str]:
+        return f"replay:{self.device_name}"
+
+    def start_server(self, commands: List[str]):
+        return _ReplayServer(self.device_name)
+
+    def open_socket(self, name: str, video: bool) -> socket.socket:
+        client_end, server_end = socket.socketpair()
+        target = self.__send_video if video else self.__discard
+        thread = threading.Thread(target=target, args=(server_end,), daemon=True)
+        self.threads.append(thread)
+        thread.start()
+        return client_end
+
+    def chunks(self) -> Iterable[bytes]:
+        """
+        Recorded stream, chunk by chunk
+        """
+        if not isinstance(self.source, (str, os.PathLike)):
+            yield from self.source
+            return
+        with open(self.source, "rb") as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def frames(self) -> Iterable[bytes]:
+        """
+        Recorded stream, frame by frame
+        """
+        parser = CodecContext.create(DECODER_NAMES[self.codec_name], "r")
+        for chunk in self.chunks():
+            for packet in parser.parse(chunk):
+                yield bytes(packet)
+        # The parser holds the last frame until the next one starts
+        for packet in parser.parse(b""):
+            yield bytes(packet)
+
+    def __send_video(self, sock: socket.socket) -> None:
+        with sock:
+            try:
+                name = self.device_name.encode("utf-8")[:63].ljust(64, b"\x00")
+                sock.sendall(b"\x00" + name + struct.pack(">HH", *self.resolution))
+                if self.fps is None:
+                    for chunk in self.chunks():
+                        sock.sendall(chunk)
+                    return
+                begin = time.perf_counter()
+                for index, frame in enumerate(self.frames()):
+                    sleep_until(begin + index / self.fps)
+                    sock.sendall(frame)
+            except OSError:  # The client closed the socket
+                pass
+
+    @staticmethod
+    def __discard(sock: socket.socket) -> None:
+        with sock:
+            try:
+                while sock.recv(0x10000):
+                    pass
+            except OSError:
+                pass
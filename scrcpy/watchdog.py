@@ -0,0 +1,65 @@
+"""
+Detect video streams which stopped making progress, e.g. a hung device encoder
+"""
+
+import time
+from typing import NamedTuple, Optional
+
+
+class StallInfo(NamedTuple):
+    """
+    Diagnostics of a stalled stream, sent to stall listeners
+    """
+
+    reason: str  # "bytes" if nothing is received, "frames" if nothing is decoded
+    byte_idle: float  # seconds since the last byte, or the connection
+    frame_idle: float  # seconds since the last frame, or the connection
+    stats: dict  # StreamStats.as_dict()
+
+
+class StallWatchdog:
+    def __init__(self, byte_timeout: Optional[float] = 5.0, frame_timeout: Optional[float] = 10.0, restart: bool = False):
+        """
+        Thresholds after which a stream is considered stalled
+
+        The server repeats the last frame while the screen is static, so a healthy stream
+        never stays silent for long. One watchdog may be shared by many clients.
+
+        Args:
+            byte_timeout: seconds without receiving anything, None disables it
+            frame_timeout: seconds without decoding a frame, None disables it
+            restart: handle a stall as a lost connection, reconnected by the client's reconnect
+                policy, also in a DeviceFleet, or stopped without one
+        """
+        assert byte_timeout is None or byte_timeout > 0, "byte_timeout must be greater than 0"
+        assert frame_timeout is None or frame_timeout > 0, "frame_timeout must be greater than 0"
+        self.byte_timeout = byte_timeout
+        self.frame_timeout = frame_timeout
+        self.restart = restart
+
+    def check(self, stats, now: Optional[float] = None) -> Optional[StallInfo]:
+        """
+        Check the stats of a stream
+
+        Args:
+            stats: StreamStats of a connected client
+            now: time.monotonic() value, current time if None
+
+        Returns:
+            Diagnostics if a threshold is exceeded, None otherwise
+        """
+        connected_at = stats.connected_at
+        if connected_at is None:
+            return None
+        if now is None:
+            now = time.monotonic()
+        # Counters outlive reconnections, progress only counts since the last one
+        byte_idle = now - max(connected_at, stats.last_byte_at or connected_at)
+        frame_idle = now - max(connected_at, stats.last_frame_at or connected_at)
+        if self.byte_timeout is not None and byte_idle >= self.byte_timeout:
+            reason = "bytes"
+        elif self.frame_timeout is not None and frame_idle >= self.frame_timeout:
+            reason = "frames"
+        else:
+            return None
+        return StallInfo(reason, byte_idle, frame_idle, stats.as_dict())
@@ -133,6 +133,7 @@ class MainWindow(QMainWindow):
             bitrate=1000000000,
             encoder_name=encoder_name,
             max_fps=15,
+            keep_session=True,
         )
         client.add_listener(scrcpy.EVENT_INIT, on_init)
         client.add_listener(scrcpy.EVENT_FRAME, on_frame)
@@ -310,6 +311,7 @@ class MainWindow(QMainWindow):
 
     def closeEvent(self, _):
         self.client.stop()
+        scrcpy.session.close_sessions()
         self.alive = False
 
 
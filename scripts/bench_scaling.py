@@ -0,0 +1,65 @@
+"""
+Decode throughput versus number of devices, one thread per simulated device
+
+Run it with a regular and a free-threaded (python3.13t) interpreter to compare:
+    python scripts/bench_scaling.py
+    python3.13t -X gil=0 scripts/bench_scaling.py
+"""
+
+import pathlib
+import pickle
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+
+from scrcpy import Client
+from scrcpy.transport import ReplayTransport
+
+VIDEO_DATA = pathlib.Path(__file__).parent.parent / "tests" / "test_video_data.pkl"
+
+
+def decode_loop(chunks, deadline, counts, index):
+    # Fed directly, the transport only keeps the client away from adb
+    client = Client(transport=ReplayTransport(chunks))
+    while time.perf_counter() < deadline:
+        # The sample starts with a keyframe, restart the stream on each pass
+        client.reset_decoder()
+        for chunk in chunks:
+            client.feed(chunk)
+    counts[index] = client.stats.frames_decoded
+
+
+def run(devices, chunks, seconds):
+    counts = [0] * devices
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=decode_loop, args=(chunks, deadline, counts, i)) for i in range(devices)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser(description="Decode throughput versus number of devices")
+    parser.add_argument("--max-devices", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+
+    chunks = [chunk for chunk in pickle.load(VIDEO_DATA.open("rb")) if chunk]
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}")
+    print(f"{'devices':>8} {'frames/s':>10} {'scaling':>8}")
+    base = None
+    devices = 1
+    while devices <= args.max_devices:
+        fps = run(devices, chunks, args.seconds)
+        base = base or fps
+        print(f"{devices:>8} {fps:>10.1f} {fps / base:>7.2f}x")
+        devices *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import pytest
+
+from scrcpy import transport
+from tests.utils import video_data  # Shared fixture
+
+
+@pytest.fixture(autouse=True)
+def jar_cache(tmp_path, monkeypatch):
+    """
+    Keep the deployed jar cache of the tests out of the user's cache directory
+    """
+    monkeypatch.setattr(transport, "JAR_CACHE_PATH", str(tmp_path / "deployed_jars.json"))
+    monkeypatch.setattr(transport, "_deployed_jars", None)
+    return transport.JAR_CACHE_PATH
@@ -0,0 +1,129 @@
+import time
+import types
+
+import pytest
+from pydantic import ValidationError
+
+from scrcpy import Client
+from scrcpy.adaptive import AdaptiveController, LagSample
+from scrcpy.options import ServerOptions
+from tests.utils import HANDSHAKE, FakeADBDevice, wait_for
+
+
+def fake_client(**options):
+    stats = types.SimpleNamespace(bytes_received=0, decode_time=0.0, last_byte_at=None, last_frame_at=None)
+    return types.SimpleNamespace(
+        options=ServerOptions(**options),
+        resolution=(1080, 2400),
+        stats=stats,
+        pending_bytes=lambda: 0,
+        fed_externally=False,
+    )
+
+
+def test_levels():
+    controller = AdaptiveController(fake_client(video_bit_rate=8000000, max_fps=60), down_after=2, up_after=3)
+    assert controller.level_options(0) == dict(video_bit_rate=8000000, max_size=0, max_fps=60)
+    assert controller.level_options(2) == dict(video_bit_rate=2000000, max_size=1800, max_fps=60)
+    assert controller.level_options(4) == dict(video_bit_rate=500000, max_size=1200, max_fps=15)
+
+    lagging = LagSample(buffered=0.5, decode_load=0.2, frame_age=0)
+    overloaded = LagSample(buffered=0, decode_load=0.95, frame_age=0)
+    fine = LagSample(buffered=0.01, decode_load=0.2, frame_age=0)
+    assert controller.update(lagging) is None
+    assert controller.update(overloaded) == 1
+    assert controller.update(lagging) is None
+    # Between a quarter of the target and the target, stay
+    assert controller.update(LagSample(0.05, 0.2, 0)) is None
+    assert controller.update(lagging) is None
+    assert [controller.update(fine) for _ in range(3)] == [None, None, 0]
+    assert controller.update(fine) is None
+
+    # Video arriving without frames for longer than max_frame_age
+    stuck = LagSample(buffered=0, decode_load=0.2, frame_age=2)
+    assert [controller.update(stuck) for _ in range(2)] == [None, 1]
+
+
+def test_levels_from_base_resolution():
+    client = fake_client(video_bit_rate=8000000)
+    controller = AdaptiveController(client, down_after=1, up_after=1)
+    lagging = LagSample(buffered=0.5, decode_load=0.2, frame_age=0)
+    fine = LagSample(buffered=0.01, decode_load=0.2, frame_age=0)
+    sizes = []
+    for sample in [lagging, lagging, lagging, fine, fine, fine]:
+        options = controller.level_options(controller.update(sample))
+        sizes.append(options["max_size"])
+        # The server scales the video down as reconfigure would
+        if options["max_size"]:
+            client.resolution = (options["max_size"] * 1080 // 2400, options["max_size"])
+    # Scaled from the 2400 pixels of the full quality stream, not from the current one
+    assert sizes == [0, 1800, 1200, 1800, 0, 0]
+    assert controller.base_size == 2400
+
+
+def test_measure():
+    client = fake_client()
+    controller = AdaptiveController(client)
+    assert controller.measure() is None
+    client.stats.bytes_received = 1000000
+    client.pending_bytes = lambda: 100000
+    sample = controller.measure()
+    # Buffered video is a tenth of what arrived in the interval
+    assert sample.buffered < 0.1 * 1.01
+    assert sample.frame_age == 0
+
+    # Video arrived after the last frame, without a new one
+    client.stats.last_frame_at = time.monotonic() - 2
+    client.stats.last_byte_at = time.monotonic()
+    assert controller.measure().frame_age >= 2
+    # Nothing arrived since the last frame: a static screen
+    client.stats.last_byte_at = client.stats.last_frame_at - 1
+    assert controller.measure().frame_age == 0
+
+
+def test_fleet_client():
+    client = fake_client()
+    client.fed_externally = True
+    with pytest.raises(AssertionError):
+        AdaptiveController(client)
+
+
+def test_reconfigure():
+    device = FakeADBDevice([list(HANDSHAKE), [], list(HANDSHAKE), []])
+    client = Client(device=device, bitrate=4000000)
+    client.start(daemon_threaded=True)
+    assert not client.fed_externally
+    with pytest.raises(ValidationError):
+        client.reconfigure(bitrate=1000)
+    client.reconfigure(video_bit_rate=1000000, max_fps=30)
+    assert client.alive
+    assert "video_bit_rate=4000000" in device.commands[0]
+    assert "video_bit_rate=1000000" in device.commands[1]
+    assert "max_fps=30" in device.commands[1]
+    client.stop()
+
+
+def test_reconfigure_gap(video_data):
+    class OverlapADBDevice(FakeADBDevice):
+        def __init__(self, data):
+            super().__init__(data)
+            self.overlapped = []
+
+        def shell(self, a, stream=True):
+            # The previous server is still streaming when the next one starts
+            self.overlapped.append(bool(self.streams) and not self.streams[0].die)
+            return super().shell(a, stream)
+
+    device = OverlapADBDevice([HANDSHAKE + video_data, [], HANDSHAKE + video_data, []])
+    frames = []
+    client = Client(device=device)
+    client.add_listener("frame", lambda frame: frame is not None and frames.append(frame))
+    client.start(daemon_threaded=True)
+    wait_for(lambda: len(frames) == 3)
+
+    gap = client.reconfigure(max_fps=30)
+    assert gap is not None and gap > 0
+    assert device.overlapped == [False, True]
+    assert device.streams[0].die
+    wait_for(lambda: len(frames) == 6)
+    client.stop()
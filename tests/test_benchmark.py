@@ -0,0 +1,37 @@
+import pytest
+
+from scrcpy.benchmark import decode_stream, load_stream, replay_client
+from scrcpy.transport import ReplayTransport
+from tests.utils import VIDEO_DATA_PATH
+
+
+def test_decode_stream(tmp_path):
+    chunks = load_stream(VIDEO_DATA_PATH)
+    result = decode_stream(chunks * 2)
+    # The flushed parser gives the last frame of the stream too
+    assert result.frames == 8
+    assert result.bytes == 2 * sum(map(len, chunks))
+    assert set(result.stages) == {"parse", "decode", "convert"}
+    assert result.fps > 0
+    assert "8 frames" in result.report()
+
+    path = tmp_path / "stream.h264"
+    path.write_bytes(b"".join(chunks))
+    assert load_stream(path, chunk_size=1000)[0] == b"".join(chunks)[:1000]
+    assert decode_stream(load_stream(path), pixel_format=None).stages["convert"] == 0
+
+
+def test_paced_replay():
+    chunks = load_stream(VIDEO_DATA_PATH) * 2
+    assert len(list(ReplayTransport(chunks).frames())) == 8
+    result = decode_stream(chunks, fps=100)
+    assert result.seconds >= 7 / 100
+    result = replay_client(chunks, fps=100)
+    # Client.feed does not flush the parser, the last frame stays in it
+    assert result.frames == 7
+    assert result.seconds >= 7 / 100
+    assert set(result.stages) == {"feed", "loop"}
+
+    # The stream loop does not wait for a decode process
+    with pytest.raises(AssertionError):
+        replay_client(chunks, decode_process=object())
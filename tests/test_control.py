@@ -5,10 +5,15 @@
 See https://github.com/Genymobile/scrcpy/issues/673#issuecomment-516360374
 """
 
+import socket
 import threading
 
+import pytest
+
 import scrcpy
-from scrcpy.control import ControlSender
+from scrcpy import gesture
+from scrcpy.control import ControlSender, split_utf8
+from scrcpy.device_message import AckClipboardMessage, ClipboardMessage
 from tests.utils import FakeStream
 
 
@@ -60,6 +65,20 @@ def test_control_text():
     )
 
 
+def test_type_text():
+    sender, writes = record_sender()
+    text = "a" * 299 + "\u4e2d" + "b" * 400
+    sender.type_text(text)
+    # One write, messages split before the 3 byte code point which would cross 300 bytes
+    assert len(writes) == 1
+    assert writes[0] == control.text("a" * 299) + control.text("\u4e2d" + "b" * 297) + control.text("b" * 103)
+
+    sender, writes = record_sender()
+    sender.add_listener(lambda package: sender.handle_device_message(AckClipboardMessage(1)))
+    sender.type_text(text, paste_threshold=500, timeout=1)
+    assert writes[0][0] == scrcpy.TYPE_SET_CLIPBOARD
+
+
 def test_control_scroll():
     assert control.scroll(100, 200, 100, 200) == (
         b"\x03"  # TYPE_INJECT_SCROLL_EVENT
@@ -84,48 +103,97 @@ def test_panels():
 
 
 def test_get_clipboard():
-    class MockClipboardParent:
-        class MockSocket:
-            @staticmethod
-            def setblocking(_):
-                pass
-
-            @staticmethod
-            def send(_):
-                pass
-
-            @staticmethod
-            def recv(b):
-                if b == 1024:
-                    raise BlockingIOError()
-                elif b == 1:
-                    return b"\x00"
-                elif b == 4:
-                    return b"\x00\x00\x00\x05"
-                return b"test0"
-
-        control_socket = MockSocket()
-        control_socket_lock = threading.Lock()
-
-    assert ControlSender(MockClipboardParent()).get_clipboard() == "test0"
+    sender, writes = record_sender()
+    first = sender.request_clipboard()
+    second = sender.request_clipboard(scrcpy.COPY_KEY_COPY)
+    assert writes == [
+        b"\x08" + b"\x00",  # TYPE_GET_CLIPBOARD, COPY_KEY_NONE
+        b"\x08" + b"\x01",  # TYPE_GET_CLIPBOARD, COPY_KEY_COPY
+    ]
+
+    sender.handle_device_message(ClipboardMessage("test0"))
+    assert first.result(0) == "test0"
+    assert not second.done()
+    sender.cancel_pending(ConnectionError())
+    with pytest.raises(ConnectionError):
+        second.result(0)
+
+    # Dropped, no request is pending
+    sender.handle_device_message(ClipboardMessage("unsolicited"))
+    third = sender.request_clipboard()
+    sender.handle_device_message(ClipboardMessage("test2"))
+    assert third.result(0) == "test2"
+
+    # Fails at once without a control socket
+    sender.parent.control_socket = None
+    with pytest.raises(ConnectionError):
+        sender.get_clipboard()
 
 
 def test_set_clipboard():
     text = "hello, world"
     assert control.set_clipboard(text, False) == (
         b"\x09"  # TYPE_SET_CLIPBOARD
+        + b"\x00\x00\x00\x00\x00\x00\x00\x00"  # Sequence: SEQUENCE_INVALID
         + b"\x00"  # Paste: false
         + b"\x00\x00\x00\x0c"  # Length: 12
         + text.encode("utf-8")
     )
-    assert control.set_clipboard(text, True) == (
+    assert control.set_clipboard(text, True, 0x1234) == (
         b"\x09"  # TYPE_SET_CLIPBOARD
+        + b"\x00\x00\x00\x00\x00\x00\x12\x34"  # Sequence: 0x1234
         + b"\x01"  # Paste: true
         + b"\x00\x00\x00\x0c"  # Length: 12
         + text.encode("utf-8")
     )
 
 
+def test_set_clipboard_ack():
+    sender, writes = record_sender()
+    first = sender.set_clipboard_async("a")
+    second = sender.set_clipboard_async("b", paste=True)
+    assert writes[0][1:9] == b"\x00\x00\x00\x00\x00\x00\x00\x01"
+    assert writes[1][1:10] == b"\x00\x00\x00\x00\x00\x00\x00\x02\x01"
+
+    sender.handle_device_message(AckClipboardMessage(2))
+    assert second.result(0) == 2
+    assert not first.done()
+    sender.cancel_pending(ConnectionError())
+    with pytest.raises(ConnectionError):
+        first.result(0)
+
+
+def test_paste_text():
+    sender, writes = record_sender()
+
+    def ack(package):
+        if package[0] == scrcpy.TYPE_SET_CLIPBOARD:
+            sequence = int.from_bytes(package[1:9], "big")
+            threading.Timer(0.001, sender.handle_device_message, [AckClipboardMessage(sequence)]).start()
+
+    sender.add_listener(ack)
+    # Two full chunks of 3 byte code points, and a short one
+    text = "\u4e2d" * (scrcpy.CLIPBOARD_TEXT_MAX_LENGTH // 3 * 2) + "end"
+    sender.paste_text(text, timeout=1)
+    assert len(writes) == 3
+    assert "".join(w[14:].decode("utf-8") for w in writes) == text
+
+    # No acknowledgement
+    sender.remove_listener(ack)
+    with pytest.raises(TimeoutError):
+        sender.paste_text("lost", timeout=0.01)
+    sender.parent.control_socket = None
+    with pytest.raises(ConnectionError):
+        sender.type_text("x" * 2000)
+
+
+def test_split_utf8():
+    assert split_utf8("", 4) == []
+    assert split_utf8("abcdefg", 4) == ["abcd", "efg"]
+    assert split_utf8("a\u4e2d\u4e2d", 4) == ["a\u4e2d", "\u4e2d"]
+    assert split_utf8("\U0001f600" * 3, 5) == ["\U0001f600"] * 3
+
+
 def test_set_screen_power_mode():
     assert control.set_screen_power_mode(scrcpy.POWER_MODE_NORMAL) == (
         b"\x0a" + b"\x02"  # TYPE_SET_SCREEN_POWER_MODE, POWER_MODE_NORMAL
@@ -143,3 +211,92 @@ def test_swipe():
     control.swipe(2000, 2000, 100, 200)
     control.swipe(2000, 2000, -100, -200)
     control.swipe(100, 200, 2010, 2010, move_step_length=100)
+
+
+class RecordSocket:
+    def __init__(self):
+        self.writes = []
+
+    def send(self, data):
+        self.writes.append(data)
+
+    sendall = send
+
+
+def record_sender():
+    parent = MockParent()
+    parent.control_socket = RecordSocket()
+    return ControlSender(parent), parent.control_socket.writes
+
+
+def test_send_without_socket():
+    sender, writes = record_sender()
+    parent = sender.parent
+
+    class DisconnectingLock:
+        """
+        The client drops its socket while the sender waits for the lock
+        """
+
+        def __enter__(self):
+            parent.control_socket = None
+
+        def __exit__(self, *_):
+            pass
+
+    parent.control_socket_lock = DisconnectingLock()
+    sender.keycode(scrcpy.KEYCODE_HOME)
+    with sender.batch():
+        sender.keycode(scrcpy.KEYCODE_HOME)
+    assert writes == []
+
+    parent.control_socket_lock = threading.Lock()
+    closed = socket.socket()
+    closed.close()
+    parent.control_socket = closed
+    sender.keycode(scrcpy.KEYCODE_HOME)
+
+
+def test_batch():
+    sender, writes = record_sender()
+    with sender.batch():
+        first = sender.keycode(scrcpy.KEYCODE_HOME, scrcpy.ACTION_DOWN)
+        with sender.batch():
+            second = sender.keycode(scrcpy.KEYCODE_HOME, scrcpy.ACTION_UP)
+        assert writes == []
+    assert writes == [first + second]
+
+
+def test_gesture():
+    sender, writes = record_sender()
+    touch_size = len(control.touch(0, 0))
+
+    sender.pinch(500, 500, 400, 100, duration=0.05, fingers=3, fps=100)
+    # One down frame, five move frames, the last one also carries the up events
+    assert [len(w) // touch_size for w in writes] == [3, 3, 3, 3, 3, 6]
+    assert writes[0][1] == scrcpy.ACTION_DOWN
+    assert writes[-1][-touch_size + 1] == scrcpy.ACTION_UP
+
+    tracks = gesture.pinch_tracks((500, 500), 400, 100)
+    assert tracks[0].position(0) == (700, 500)
+    assert tracks[1].position(1) == (450, 500)
+    tracks = gesture.rotate_tracks((500, 500), 100, 90)
+    assert tracks[0].position(1) == (500, 600)
+    tracks = gesture.swipe_tracks([(0, 0), (10, 10)], [(100, 0), (110, 10)])
+    assert [t.touch_id for t in tracks] == [0, 1]
+    assert tracks[1].position(0.5) == (60, 10)
+
+
+def test_start_app():
+    assert control.start_app("org.example.app") == b"\x10" + b"\x0f" + b"org.example.app"
+    with pytest.raises(AssertionError):
+        control.start_app("")
+
+
+def test_coordinate_space():
+    sender = ControlSender(MockParent())
+    sender.coordinate_space = (960, 540)
+    assert sender.screen_size() == (960, 540)
+    # Scaled to the frame resolution (1920, 1080)
+    assert sender.touch(100, 200) == control.touch(200, 400)
+    assert sender.scroll(480, 270, 0, 1) == control.scroll(960, 540, 0, 1)
@@ -1,46 +1,26 @@
-import pathlib
-import pickle
+import os
+import socket
+import threading
 
 import pytest
 from adbutils import AdbError
+from adbutils._proto import FileInfo
 
-from scrcpy import Client
-from tests.utils import FakeStream
-
-
-class Sync:
-    @staticmethod
-    def push(a, b):
-        pass
-
-
-class FakeADBDevice:
-    sync = Sync()
-
-    def __init__(self, data, wait=0):
-        self.data = data
-        self.__wait = wait
-
-    @staticmethod
-    def shell(a, stream=True):
-        return FakeStream([b"\x00" * 128])
-
-    def create_connection(self, a, b):
-        if self.__wait > 0:
-            self.__wait -= 1
-            raise AdbError()
-
-        return FakeStream(self.data.pop(0))
+from scrcpy import Client, transport
+from scrcpy.reconnect import ReconnectPolicy
+from scrcpy.tcp import TcpForward
+from scrcpy.transport import REMOTE_JAR_PATH, _server_jar
+from tests.utils import HANDSHAKE, FakeADBDevice, FakeStream
 
 
 def test_connection():
-    client = Client(device=FakeADBDevice([[b"\x00", b"test", b"\x07\x80\x04\x38"], []], wait=3))
+    client = Client(device=FakeADBDevice([list(HANDSHAKE), []], wait=3))
     client.start(threaded=True)
     client.stop()
 
     with pytest.raises(ConnectionError):
         client = Client(
-            device=FakeADBDevice([[b"\x00", b"test", b"\x07\x80\x04\x38"], []], wait=1000),
+            device=FakeADBDevice([list(HANDSHAKE), []], wait=1000),
             connection_timeout=1000,
         )
         client.start(threaded=True)
@@ -66,7 +46,7 @@ def test_init_listener():
         assert client.device_name == "test"
         client.stop()
 
-    client = Client(device=FakeADBDevice([[b"\x00", b"test", b"\x07\x80\x04\x38"], []]))
+    client = Client(device=FakeADBDevice([list(HANDSHAKE), []]))
 
     client.add_listener("init", on_init)
     assert client.listeners["init"] == [on_init]
@@ -77,16 +57,14 @@ def test_init_listener():
     client.start(threaded=True)
 
 
-def test_parse_video():
+def test_parse_video(video_data):
     def on_frame(frame):
         frames.append(frame)
         if len(frames) == 5:
             client.stop()
 
-    # Load test data
-    video_data = pickle.load((pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb"))
     data = [
-        [b"\x00", b"test", b"\x07\x80\x04\x38", None] + video_data + [b"OSError"],
+        HANDSHAKE + [None] + video_data + [b"OSError"],
         [],
     ]
     frames = []
@@ -98,6 +76,215 @@ def test_parse_video():
         client.start()
 
     # Wait frames
+    assert "first_frame" in client.stats.startup
     assert frames[0] is None
     assert frames[1].shape == (800, 368, 3)
     assert frames[2].shape == (800, 368, 3)
+
+
+def test_push_cache(jar_cache, monkeypatch):
+    class PushDevice(FakeADBDevice):
+        serial = "push-cache"
+
+        def __init__(self, data, remote_sha256):
+            super().__init__(data)
+            self.remote_sha256 = remote_sha256
+            self.pushes = 0
+            self.checks = 0
+            self.sync = self
+
+        def push(self, a, b):
+            self.pushes += 1
+            self.remote = FileInfo(0, _server_jar()[1], self.pushes, REMOTE_JAR_PATH)
+
+        def stat(self, path):
+            return getattr(self, "remote", FileInfo(0, 0, None, path))
+
+        def shell(self, a, stream=False):
+            if stream:
+                return FakeStream([b"\x00" * 128])
+            self.checks += 1
+            return f"{self.remote_sha256}  {REMOTE_JAR_PATH}"
+
+    def start_stop(device):
+        client = Client(device=device)
+        client.start(threaded=True)
+        client.stop()
+
+    # Missing jar, pushed once then cached
+    device = PushDevice([list(HANDSHAKE), [], list(HANDSHAKE), []], "")
+    start_stop(device)
+    start_stop(device)
+    assert device.pushes == 1
+
+    # Jar of the same size on the device, unknown to this process, checked by hash
+    device = PushDevice([list(HANDSHAKE), []], "bad")
+    device.serial = "push-cache-2"
+    device.remote = FileInfo(0, _server_jar()[1], 0, REMOTE_JAR_PATH)
+    start_stop(device)
+    assert device.pushes == 1
+
+    device = PushDevice([list(HANDSHAKE), []], _server_jar()[2])
+    device.serial = "push-cache-3"
+    device.remote = FileInfo(0, _server_jar()[1], 0, REMOTE_JAR_PATH)
+    start_stop(device)
+    assert device.pushes == 0
+    assert device.checks == 1
+
+    # A new process trusts the jars the previous ones checked
+    monkeypatch.setattr(transport, "_deployed_jars", None)
+    assert os.path.exists(jar_cache)
+    device = PushDevice([list(HANDSHAKE), []], "bad")
+    device.serial = "push-cache-3"
+    device.remote = FileInfo(0, _server_jar()[1], 0, REMOTE_JAR_PATH)
+    start_stop(device)
+    assert (device.pushes, device.checks) == (0, 0)
+
+
+def test_server_ready():
+    class LogDevice(FakeADBDevice):
+        def __init__(self, data, output):
+            super().__init__(data)
+            self.output = output
+
+        def shell(self, a, stream=True):
+            return FakeStream(list(self.output))
+
+    # Ready signal split over two reads, the rest of the output is not waited for
+    output = [b"[server] INFO: Dev", b"ice: [Google] Pixel\n", b"OSError"]
+    client = Client(device=LogDevice([list(HANDSHAKE), []], output))
+    client.start(threaded=True)
+    client.stop()
+    assert set(client.stats.startup) == {"push", "launch", "connect", "handshake"}
+
+    with pytest.raises(ConnectionError) as e:
+        output = [b"[server] ERROR: Could not open video stream\n"]
+        client = Client(device=LogDevice([list(HANDSHAKE), []], output))
+        client.start(threaded=True)
+    assert "Could not open video stream" in str(e.value)
+
+    with pytest.raises(ConnectionError) as e:
+        client = Client(device=LogDevice([list(HANDSHAKE), []], [b"Aborted", b""]))
+        client.start(threaded=True)
+    assert "exited" in str(e.value)
+
+
+def test_reconnect(video_data):
+    class FlakyADBDevice(FakeADBDevice):
+        def create_connection(self, a, b):
+            if not self.data:
+                raise AdbError()
+            return super().create_connection(a, b)
+
+    def on_frame(frame):
+        if frame is not None:
+            frames.append(frame)
+        if len(frames) == 6:
+            client.stop()
+
+    data = [HANDSHAKE + video_data + [b"OSError"], [], HANDSHAKE + video_data, []]
+    frames = []
+    reconnects = []
+    client = Client(device=FlakyADBDevice(data), reconnect=ReconnectPolicy(initial_delay=0.001))
+    client.add_listener("frame", on_frame)
+    client.add_listener("reconnect", reconnects.append)
+    client.start()
+    assert len(frames) == 6
+    assert reconnects == [1]
+    assert client.stats.reconnects == 1
+    assert client.stats.frames_decoded == 6
+
+    # Gives up after max_attempts
+    disconnected = []
+    client = Client(
+        device=FlakyADBDevice([HANDSHAKE + [b"OSError"], []]),
+        reconnect=ReconnectPolicy(max_attempts=2, initial_delay=0.001),
+        connection_timeout=100,
+    )
+    client.add_listener("disconnect", lambda: disconnected.append(1))
+    with pytest.raises(OSError):
+        client.start()
+    assert disconnected == [1]
+    assert client.stats.reconnects == 0
+
+
+def test_reconnect_policy():
+    policy = ReconnectPolicy(max_attempts=5, initial_delay=1, max_delay=4, jitter=0.5)
+    delays = list(policy.delays())
+    assert len(delays) == 5
+    for delay, base in zip(delays, [1, 2, 4, 4, 4]):
+        assert base / 2 <= delay <= base
+    assert list(ReconnectPolicy(max_attempts=3, initial_delay=0.5, jitter=0).delays()) == [0.5, 1, 2]
+
+
+def test_decoder_recovery(video_data):
+    corrupted = b"\x00\x00\x00\x01\x41" + b"\xff" * 200
+    data = [HANDSHAKE + video_data + [corrupted] * 3 + video_data + [b"OSError"], []]
+    device = FakeADBDevice(data)
+    client = Client(device=device, block_frame=True)
+    with pytest.raises(OSError):
+        client.start()
+
+    # The first stream's last frame is flushed by the corrupted data
+    assert client.stats.frames_decoded == 7
+    assert client.stats.decode_errors == 1
+    assert client.stats.dropped_packets == 2
+    assert client.stats.recoveries == 1
+    # Reset video, requested once
+    assert device.sent == [b"\x11"]
+
+
+def test_scid():
+    device = FakeADBDevice([list(HANDSHAKE), [], list(HANDSHAKE), []])
+    clients = [Client(device=device), Client(device=device)]
+    for client in clients:
+        client.start(daemon_threaded=True)
+    # Two servers on the same device, each one on its own socket
+    assert clients[0].scid != clients[1].scid
+    for client, command, names in zip(clients, device.commands, [device.names[:2], device.names[2:]]):
+        assert f"scid={client.scid:08x}" in command
+        assert names == [f"scrcpy_{client.scid:08x}"] * 2
+        client.stop()
+
+
+def test_tcp_forward():
+    class ForwardADBDevice(FakeADBDevice):
+        def __init__(self, data):
+            super().__init__(data)
+            self.forwards = {}
+
+        def forward_port(self, remote):
+            self.forwards[listener.getsockname()[1]] = remote
+            return listener.getsockname()[1]
+
+        def forward_remove(self, local, raise_non_found=True):
+            del self.forwards[int(local[len("tcp:") :])]
+
+    def serve():
+        # Like adb before the server listens: accept, then close
+        listener.accept()[0].close()
+        video, _ = listener.accept()
+        video.sendall(b"\x00")
+        control, _ = listener.accept()
+        video.sendall(b"test".ljust(64, b"\x00") + b"\x07\x80\x04\x38")
+        connections.extend([video, control])
+
+    listener = socket.create_server(("127.0.0.1", 0))
+    connections = []
+    server = threading.Thread(target=serve)
+    server.start()
+    device = ForwardADBDevice([])
+    client = Client(device=device, tcp=TcpForward(receive_buffer=256 * 1024, keepalive=10))
+    client.connect()
+    server.join()
+    assert client.device_name == "test"
+    assert client.resolution == (1920, 1080)
+    # The forward is only needed to connect
+    assert device.forwards == {}
+    assert client.control_socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+    assert not client.video_socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+    assert client.video_socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 256 * 1024
+    assert client.video_socket.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+    client.stop()
+    for connection in connections + [listener]:
+        connection.close()
@@ -0,0 +1,48 @@
+import pytest
+
+from scrcpy.device_message import (
+    AckClipboardMessage,
+    ClipboardMessage,
+    DeviceMessageParser,
+    DeviceMessageReader,
+    UhidOutputMessage,
+)
+from tests.utils import FakeStream
+
+DATA = (
+    b"\x00"  # DEVICE_MSG_TYPE_CLIPBOARD
+    + b"\x00\x00\x00\x05"  # Length: 5
+    + b"test0"
+    + b"\x01"  # DEVICE_MSG_TYPE_ACK_CLIPBOARD
+    + b"\x00\x00\x00\x00\x00\x00\x01\x02"  # Sequence: 0x0102
+    + b"\x02"  # DEVICE_MSG_TYPE_UHID_OUTPUT
+    + b"\x00\x01"  # Id: 1
+    + b"\x00\x02"  # Size: 2
+    + b"\xab\xcd"
+)
+MESSAGES = [ClipboardMessage("test0"), AckClipboardMessage(0x0102), UhidOutputMessage(1, b"\xab\xcd")]
+
+
+def test_parse():
+    assert DeviceMessageParser().feed(DATA) == MESSAGES
+
+    # Byte by byte
+    parser = DeviceMessageParser()
+    messages = []
+    for i in range(len(DATA)):
+        messages += parser.feed(DATA[i : i + 1])
+    assert messages == MESSAGES
+    assert parser.buffer == b""
+
+    with pytest.raises(ValueError):
+        DeviceMessageParser().feed(b"\xff")
+
+
+def test_reader():
+    messages = []
+    closed = []
+    reader = DeviceMessageReader(FakeStream([DATA[:7], None, DATA[7:], b""]), messages.append, lambda: closed.append(1))
+    reader.start()
+    reader.thread.join(1)
+    assert messages == MESSAGES
+    assert closed == [1]
@@ -0,0 +1,118 @@
+import pytest
+
+from scrcpy import Client
+from scrcpy.fleet import DeviceFleet, start_all
+from scrcpy.reconnect import ReconnectPolicy
+from tests.utils import SocketADBDevice, wait_for
+
+
+@pytest.mark.parametrize("decode_processes", [0, 1])
+def test_fleet(decode_processes, video_data):
+    fleet = DeviceFleet(workers=2, decode_processes=decode_processes)
+    # No worker process until the fleet starts
+    assert fleet.decode_processes == []
+    fleet.start(daemon_threaded=True)
+    assert len(fleet.decode_processes) == decode_processes
+    devices = [SocketADBDevice(f"serial{i}") for i in range(3)]
+    clients = [fleet.add(Client(device=device)) for device in devices]
+    assert clients[0].device_name == "test"
+
+    futures = [client.control.set_clipboard_async("a") for client in clients]
+    for device in devices:
+        for chunk in video_data:
+            device.peers[0].sendall(chunk)
+        # AckClipboard on the control socket
+        device.peers[1].sendall(b"\x01" + b"\x00" * 7 + b"\x01")
+    wait_for(lambda: all(s["frames_decoded"] == 3 for s in fleet.status().values()))
+    assert clients[2].last_frame.shape == (800, 368, 3)
+    assert all(future.result(1) == 1 for future in futures)
+
+    disconnected = []
+    clients[1].add_listener("disconnect", lambda: disconnected.append(1))
+    devices[1].peers[0].close()
+    wait_for(lambda: disconnected)
+    assert fleet.status()["serial1"]["alive"] is False
+    assert "disconnected" in fleet.status()["serial1"]["error"]
+
+    fleet.remove(clients[0])
+    assert set(fleet.status()) == {"serial1", "serial2"}
+    fleet.stop()
+    assert not clients[2].alive
+    assert fleet.decode_processes == []
+
+
+def test_fleet_reconnect(video_data):
+    fleet = DeviceFleet()
+    fleet.start(daemon_threaded=True)
+    device = SocketADBDevice("serial0")
+    client = fleet.add(Client(device=device, reconnect=ReconnectPolicy(initial_delay=0.001)))
+    reconnects = []
+    client.add_listener("reconnect", reconnects.append)
+
+    device.peers[0].close()
+    wait_for(lambda: len(device.peers) == 4)
+    wait_for(lambda: reconnects == [1])
+    assert client.alive
+    assert client.stats.reconnects == 1
+    # The new sockets are attached to the loop
+    for chunk in video_data:
+        device.peers[2].sendall(chunk)
+    wait_for(lambda: fleet.status()["serial0"]["frames_decoded"] == 3)
+    fleet.stop()
+    assert not client.alive
+
+
+def test_fleet_same_device():
+    fleet = DeviceFleet()
+    fleet.start(daemon_threaded=True)
+    first = fleet.add(Client(device=SocketADBDevice("same")))
+    second = fleet.add(Client(device=SocketADBDevice("same")))
+    status = fleet.status()
+    assert set(status) == {"same", "same#2"}
+    assert {entry["serial"] for entry in status.values()} == {"same"}
+
+    fleet.remove(first)
+    wait_for(lambda: not first.alive)
+    assert second.alive
+    assert set(fleet.status()) == {"same#2"}
+    third = fleet.add(Client(device=SocketADBDevice("same")))
+    assert set(fleet.status()) == {"same", "same#2"}
+    fleet.stop()
+    assert not second.alive and not third.alive
+
+
+def test_fleet_reconfigure():
+    fleet = DeviceFleet()
+    fleet.start(daemon_threaded=True)
+    client = fleet.add(Client(device=SocketADBDevice("serial0"), bitrate=4000000))
+    assert client.fed_externally
+    # The fleet would not read the sockets of a new server
+    with pytest.raises(RuntimeError):
+        client.reconfigure(video_bit_rate=1000000)
+    assert client.options.video_bit_rate == 4000000
+    fleet.stop()
+    assert not client.fed_externally
+
+
+def test_start_all():
+    class FailingDevice(SocketADBDevice):
+        def create_connection(self, a, b):
+            raise ConnectionError("offline")
+
+    devices = [SocketADBDevice("serial0"), FailingDevice("serial1"), SocketADBDevice("serial2")]
+    clients = [Client(device=device, connection_timeout=100) for device in devices]
+    results = start_all(clients, max_workers=2)
+    assert [result.client for result in results] == clients
+    assert [result.ok for result in results] == [True, False, True]
+    assert "offline" in str(results[1].error)
+    assert all(result.elapsed > 0 for result in results)
+    for client in clients:
+        client.stop()
+
+    fleet = DeviceFleet()
+    fleet.start(daemon_threaded=True)
+    devices = [SocketADBDevice("serial0"), FailingDevice("serial1")]
+    results = fleet.add_all([Client(device=device, connection_timeout=100) for device in devices])
+    assert [result.ok for result in results] == [True, False]
+    assert set(fleet.status()) == {"serial0"}
+    fleet.stop()
@@ -0,0 +1,91 @@
+import threading
+import types
+
+import numpy as np
+
+from scrcpy.latency import LatencyProbe, LatencyStats, measure_clients
+
+
+class FakeClient:
+    """
+    Client whose screen changes a delay after each input, at the given area
+    """
+
+    def __init__(self, serial, delay, area=(slice(0, 10), slice(0, 10))):
+        self.transport = types.SimpleNamespace(serial=serial)
+        self.last_frame = np.zeros((100, 50, 3), dtype=np.uint8)
+        self.listeners = []
+        self.control = self
+        self.delay = delay
+        self.area = area
+
+    def frame_state(self):
+        return self.last_frame, (50, 100)
+
+    def add_listener(self, cls, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, cls, listener):
+        self.listeners.remove(listener)
+
+    def publish(self, frame):
+        self.last_frame = frame
+        for listener in list(self.listeners):
+            listener(frame)
+
+    def toggle(self):
+        frame = self.last_frame.copy()
+        frame[self.area] = 255 - frame[self.area]
+        # An unchanged frame first, then the change
+        threading.Timer(self.delay / 2, self.publish, [self.last_frame.copy()]).start()
+        threading.Timer(self.delay, self.publish, [frame]).start()
+
+
+def test_probe():
+    client = FakeClient("a", 0.02)
+    probe = LatencyProbe(client, lambda control: control.toggle(), roi=(20, 20, 0, 0), settle=0.05)
+    stats = probe.run(3)
+    assert stats.trials == 3 and stats.misses == 0
+    assert 0.02 <= stats.p50 < 0.5
+    assert len(probe.samples) == 3
+    # Back and forth, the last frame is the reference of the next trial
+    assert client.last_frame[0, 0, 0] == 255
+
+    # Changes outside the region are not seen
+    probe = LatencyProbe(client, lambda control: control.toggle(), roi=(20, 20, 30, 80), timeout=0.1, settle=0)
+    assert probe.trial() is None
+
+
+def test_stats():
+    stats = LatencyStats.from_samples([0.01, 0.02, None, 0.03])
+    assert stats.misses == 1
+    assert abs(stats.mean - 0.02) < 1e-9 and stats.max == 0.03
+    assert "1 missed" in stats.report()
+    assert LatencyStats.from_samples([None]).mean is None
+
+
+def test_measure_clients():
+    clients = [FakeClient("a", 0.01), FakeClient("b", 0.05)]
+    results = measure_clients(clients, lambda control: control.toggle(), trials=2, roi=(20, 20, 0, 0), settle=0.02)
+    assert [client for client, _ in results] == clients
+    assert results[0][1].p50 < results[1][1].p50
+
+
+def test_measure_clients_same_device():
+    class TcpLike:
+        serial = "a"
+
+    # Two sessions of device a on the same transport, and one on another transport
+    clients = [FakeClient("a", 0.01), FakeClient("a", 0.01), FakeClient("a", 0.01), FakeClient("b", 0.01)]
+    clients[2].transport = TcpLike()
+    sent = []
+
+    def action(control):
+        sent.append(control)
+        control.toggle()
+
+    results = measure_clients(clients, action, trials=2, roi=(20, 20, 0, 0), settle=0.02)
+    assert [client for client, _ in results] == clients
+    assert all(stats.trials == 2 for _, stats in results)
+    # The inputs of one device are never interleaved
+    assert [client for client in sent if client is not clients[3]] == [clients[0]] * 2 + [clients[1]] * 2 + [clients[2]] * 2
@@ -0,0 +1,93 @@
+import pytest
+from pydantic import ValidationError
+
+import scrcpy
+from scrcpy import options
+from scrcpy.options import ServerOptions, capture_orientation_from_lock
+from tests.utils import FakeADBDevice
+
+
+def test_to_args():
+    args = ServerOptions(
+        max_size=1024,
+        max_fps=30,
+        video_codec="h265",
+        video_codec_options={"i-frame-interval": 1, "latency": 0.5, "vendor.key": "low"},
+        crop=(1080, 1200, 0, 300),
+        display_id=2,
+        capture_orientation="@90",
+        stay_awake=True,
+    ).to_args()
+    assert args == [
+        "max_size=1024",
+        "max_fps=30",
+        "video_bit_rate=8000000",
+        "video_codec=h265",
+        "video_codec_options=i-frame-interval=1,latency:float=0.5,vendor.key:string=low",
+        "crop=1080:1200:0:300",
+        "display_id=2",
+        "capture_orientation=@90",
+        "stay_awake=true",
+        "show_touches=false",
+        "power_off_on_close=false",
+    ]
+    assert ServerOptions(video_codec="h265").decoder_name == "hevc"
+
+
+def test_validation():
+    for invalid in [
+        dict(max_size=-1),
+        dict(video_codec="vp8"),
+        dict(crop=(0, 100, 0, 0)),
+        dict(capture_orientation="45"),
+        dict(video_codec_options={"a,b": 1}),
+        dict(video_source="camera", display_id=1),
+    ]:
+        with pytest.raises(ValidationError):
+            ServerOptions(**invalid)
+    ServerOptions(capture_orientation="@")
+    ServerOptions(capture_orientation="flip270")
+
+
+def test_server_version(monkeypatch):
+    monkeypatch.setattr(options, "SERVER_VERSION", "2.7")
+    ServerOptions(video_source="camera")
+    with pytest.raises(ValidationError) as e:
+        ServerOptions(capture_orientation="@0")
+    assert "not supported by server 2.7" in str(e.value)
+
+
+def test_client_options():
+    assert capture_orientation_from_lock(scrcpy.LOCK_SCREEN_ORIENTATION_UNLOCKED) is None
+    assert capture_orientation_from_lock(scrcpy.LOCK_SCREEN_ORIENTATION_INITIAL) == "@"
+    assert capture_orientation_from_lock(scrcpy.LOCK_SCREEN_ORIENTATION_1) == "@270"
+
+    # Legacy arguments are now all sent
+    client = scrcpy.Client(
+        device=FakeADBDevice([]),
+        max_width=800,
+        stay_awake=True,
+        lock_screen_orientation=scrcpy.LOCK_SCREEN_ORIENTATION_3,
+    )
+    args = client.options.to_args()
+    assert "max_size=800" in args
+    assert "stay_awake=true" in args
+    assert "capture_orientation=@90" in args
+
+    client = scrcpy.Client(device=FakeADBDevice([]), options=ServerOptions(video_codec="av1"))
+    assert "video_codec=av1" in client.options.to_args()
+
+
+def test_new_display():
+    assert "new_display=1920x1080/420" in ServerOptions(new_display="1920x1080/420").to_args()
+    assert "new_display=" in ServerOptions(new_display="").to_args()
+    assert not any(arg.startswith("new_display") for arg in ServerOptions().to_args())
+    ServerOptions(new_display="/240")
+    for invalid in [
+        dict(new_display="1920x"),
+        dict(new_display="0x0"),
+        dict(new_display="1920x1080", display_id=1),
+        dict(new_display="", video_source="camera"),
+    ]:
+        with pytest.raises(ValidationError):
+            ServerOptions(**invalid)
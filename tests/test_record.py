@@ -0,0 +1,84 @@
+import io
+import time
+
+import pytest
+
+import scrcpy
+from scrcpy.record import InputRecorder, InputReplayer, read_recording
+from scrcpy.timing import sleep_until
+from tests.test_control import record_sender
+
+
+def test_record_replay():
+    sender, _ = record_sender()
+    log = io.BytesIO()
+    with InputRecorder(sender, log) as recorder:
+        down = sender.touch(100, 200, scrcpy.ACTION_DOWN)
+        time.sleep(0.02)
+        up = sender.touch(100, 200, scrcpy.ACTION_UP)
+    assert recorder.count == 2
+
+    log.seek(0)
+    events = list(read_recording(log))
+    assert [package for _, package in events] == [down, up]
+    assert events[1][0] - events[0][0] >= 20_000_000
+
+    log.seek(0)
+    replayer = InputReplayer(log)
+    targets = [record_sender() for _ in range(3)]
+    start = time.perf_counter()
+    replayer.play([target for target, _ in targets], speed=2)
+    assert time.perf_counter() - start >= 0.01
+    for _, writes in targets:
+        assert writes == [down, up]
+
+    with pytest.raises(ValueError):
+        list(read_recording(io.BytesIO(b"\x00" * 16)))
+
+
+def test_sleep_until():
+    deadline = time.perf_counter() + 0.005
+    sleep_until(deadline)
+    # Never early, the overshoot bound leaves room for loaded machines
+    assert 0 <= time.perf_counter() - deadline < 0.05
+
+
+def test_replay_parallel():
+    sender, _ = record_sender()
+    log = io.BytesIO()
+    with InputRecorder(sender, log):
+        sender.touch(100, 200, scrcpy.ACTION_DOWN)
+        sender.touch(100, 200, scrcpy.ACTION_UP)
+    log.seek(0)
+
+    slow, _ = record_sender()
+    fast, _ = record_sender()
+    slow_send, sent_at = slow.send, []
+    slow.send = lambda package: (time.sleep(0.1), slow_send(package))
+    fast.add_listener(lambda package: sent_at.append(time.perf_counter()))
+    start = time.perf_counter()
+    InputReplayer(log).play([slow, fast])
+    # The slow device does not hold back the other one
+    assert sent_at[-1] - start < 0.1
+
+
+def test_replay_other_resolution():
+    sender, _ = record_sender()
+    log = io.BytesIO()
+    with InputRecorder(sender, log):
+        sender.touch(960, 540, scrcpy.ACTION_DOWN)
+        sender.scroll(480, 270, 0, 1)
+        sender.keycode(scrcpy.KEYCODE_HOME)
+    log.seek(0)
+
+    target, writes = record_sender()
+    target.parent.resolution = (1280, 720)
+    InputReplayer(log).play(target)
+    # As if sent through the target itself, on its frames
+    expected, _ = record_sender()
+    expected.parent.resolution = (1280, 720)
+    assert writes == [
+        expected.touch(640, 360, scrcpy.ACTION_DOWN),
+        expected.scroll(320, 180, 0, 1),
+        expected.keycode(scrcpy.KEYCODE_HOME),
+    ]
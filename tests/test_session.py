@@ -0,0 +1,62 @@
+from scrcpy import Client
+from scrcpy.session import close_sessions, parked_sessions
+from tests.utils import FakeStream, SocketADBDevice, wait_for
+
+
+class DeployCountingDevice(SocketADBDevice):
+    def __init__(self, serial):
+        super().__init__(serial)
+        self.deploys = 0
+
+    def shell(self, a, stream=True):
+        self.deploys += 1
+        self.peers = []
+        return FakeStream([b"\x00" * 128])
+
+
+def test_keep_session(video_data):
+    device = DeployCountingDevice("session")
+
+    client = Client(device=device, keep_session=True)
+    client.start(daemon_threaded=True)
+    client.stop()
+    assert device.deploys == 1
+    assert len(parked_sessions()) == 1
+    # Encoded while nobody was watching, dropped on attach
+    device.peers[0].sendall(video_data[1])
+
+    client = Client(device=device, keep_session=True)
+    client.start(daemon_threaded=True)
+    assert device.deploys == 1
+    assert parked_sessions() == []
+    assert "attach" in client.stats.startup
+    assert client.device_name == "test"
+    # Reset video request
+    assert device.peers[1].recv(1) == b"\x11"
+
+    for chunk in video_data:
+        device.peers[0].sendall(chunk)
+    wait_for(lambda: client.stats.frames_decoded == 3)
+    future = client.control.set_clipboard_async("a")
+    device.peers[1].sendall(b"\x01" + b"\x00" * 7 + b"\x01")
+    assert future.result(1) == 1
+    client.stop()
+
+    # Other options need their own server
+    other = Client(device=device, bitrate=1000, keep_session=True)
+    other.start(daemon_threaded=True)
+    assert device.deploys == 2
+    assert len(parked_sessions()) == 1
+    other.stop()
+    assert len(parked_sessions()) == 2
+
+    close_sessions("session")
+    assert parked_sessions() == []
+
+    # A disconnected client has nothing to park
+    client = Client(device=device, keep_session=True)
+    client.start(daemon_threaded=True)
+    device.peers[0].close()
+    wait_for(lambda: not client.alive)
+    client.stop()
+    assert parked_sessions() == []
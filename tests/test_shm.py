@@ -0,0 +1,124 @@
+import threading
+import uuid
+
+import numpy as np
+
+from scrcpy.decode_process import DecodeProcess
+from scrcpy.shm import FORMAT_GRAY8, FramePublisher, FrameRing, FrameSubscriber
+from tests.utils import wait_for
+
+
+def test_frame_ring():
+    ring = FrameRing.create(slots=2, slot_size=4 * 6 * 3)
+    reader = FrameRing.attach(ring.name)
+    assert reader.read() is None
+
+    frames = [np.full((4, 6, 3), i, np.uint8) for i in range(3)]
+    assert ring.write(frames[0], pts=100) == 1
+    first = reader.read()
+    assert (first.seq, first.pts) == (1, 100)
+    assert (first.frame == frames[0]).all()
+
+    ring.write(frames[1])
+    ring.write(frames[2])
+    # Slot of the first frame has been reused
+    assert not reader.is_valid(1)
+    assert reader.read(1) is None
+    assert (reader.read(3).frame == frames[2]).all()
+    assert reader.latest == 3
+
+    gray = reader.read(ring.write(np.zeros((2, 2), np.uint8), format=FORMAT_GRAY8))
+    assert gray.frame.shape == (2, 2)
+    assert gray.format == FORMAT_GRAY8
+
+    del first, gray
+    reader.close()
+    ring.close()
+
+
+def test_decode_process(video_data):
+    frames = []
+    done = threading.Event()
+
+    def on_frame(frame, seq):
+        frames.append((seq, frame.shape, frame.flags.owndata))
+        if len(frames) == 3:
+            done.set()
+
+    process = DecodeProcess()
+    try:
+        stream = process.open_stream(on_frame, flip=True)
+        decoded = []
+        stream.on_decoded = decoded.append
+        for chunk in video_data:
+            stream.feed(chunk)
+        assert done.wait(30)
+        wait_for(lambda: len(decoded) == len(video_data))
+        assert sum(decoded) > 0
+        assert frames == [(1, (800, 368, 3), False), (2, (800, 368, 3), False), (3, (800, 368, 3), False)]
+        stream.close()
+    finally:
+        process.close()
+    assert not process.process.is_alive()
+
+
+def test_decode_process_recovery(video_data):
+    corrupted = b"\x00\x00\x00\x01\x41" + b"\xff" * 200
+    errors = []
+    recovered = threading.Event()
+    dropped = []
+
+    def on_recovered(count):
+        dropped.append(count)
+        recovered.set()
+
+    process = DecodeProcess()
+    try:
+        stream = process.open_stream(lambda frame, seq: None)
+        stream.on_error = errors.append
+        stream.on_recovered = on_recovered
+        for chunk in video_data + [corrupted] * 3 + video_data:
+            stream.feed(chunk)
+        assert recovered.wait(30)
+        assert errors == ["InvalidDataError"]
+        assert dropped == [2]
+        stream.close()
+    finally:
+        process.close()
+
+
+def test_publisher_subscriber():
+    name = f"scrcpy-test-{uuid.uuid4().hex[:8]}"
+    subscriber = FrameSubscriber(name)
+    assert subscriber.latest() is None
+
+    publisher = FramePublisher(name)
+    publisher(np.full((4, 6, 3), 1, np.uint8))
+    frame = subscriber.wait(timeout=1)
+    assert frame.seq == 1
+    assert (frame.frame == 1).all()
+    assert subscriber.wait(after=1, timeout=0.01) is None
+
+    seq = publisher.publish(np.full((4, 6, 3), 2, np.uint8), pts=5)
+    frame = subscriber.wait(after=1, timeout=1)
+    assert (frame.seq, frame.pts) == (seq, 5)
+    assert subscriber.is_valid(seq)
+
+    # Larger frame, the ring is recreated under the same name and the subscriber follows
+    resized = publisher.publish(np.full((8, 6, 3), 9, np.uint8))
+    assert resized == seq + 1
+    assert not subscriber.is_valid(seq)
+    frame = subscriber.wait(after=seq, timeout=1)
+    assert frame.seq == resized
+    assert frame.frame.shape == (8, 6, 3)
+    assert (frame.frame == 9).all()
+    del frame
+    # Rotated back, a smaller frame fits in the new ring, then larger again
+    publisher.publish(np.full((6, 8, 3), 3, np.uint8))
+    assert publisher.publish(np.full((16, 6, 3), 4, np.uint8)) == resized + 2
+    frame = subscriber.wait(after=resized + 1, timeout=1)
+    assert frame.frame.shape == (16, 6, 3)
+
+    del frame
+    subscriber.close()
+    publisher.close()
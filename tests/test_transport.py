@@ -0,0 +1,49 @@
+import pytest
+
+from scrcpy import Client
+from scrcpy.transport import ReplayTransport, Transport
+
+
+def replay(transport):
+    frames = []
+    client = Client(transport=transport, block_frame=True)
+    client.add_listener("frame", frames.append)
+    # The stream ends with the recording
+    with pytest.raises(ConnectionError):
+        client.start()
+    return client, frames
+
+
+def test_replay_chunks(video_data):
+    client, frames = replay(ReplayTransport(video_data, resolution=(368, 800), device_name="recorded"))
+    assert client.device is None
+    assert client.device_name == "recorded"
+    assert client.resolution == (368, 800)
+    assert len(frames) > 0 and frames[0].shape == (800, 368, 3)
+    assert client.stats.frames_decoded == len(frames)
+
+    # Control messages are read and dropped
+    client = Client(transport=ReplayTransport(video_data))
+    client.connect()
+    client.control.back_or_turn_screen_on()
+    client.stop()
+
+
+def test_replay_file(tmp_path, video_data):
+    path = tmp_path / "stream.h264"
+    path.write_bytes(b"".join(video_data))
+    _, file_frames = replay(ReplayTransport(path, chunk_size=1000))
+    _, chunk_frames = replay(ReplayTransport(video_data))
+    assert len(file_frames) == len(chunk_frames)
+
+
+def test_abstract_transport():
+    with pytest.raises(TypeError):
+        Transport()
+
+    class ServerOnly(Transport):
+        def start_server(self, commands):
+            return None
+
+    with pytest.raises(TypeError):
+        ServerOnly()
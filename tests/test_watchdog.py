@@ -0,0 +1,89 @@
+import types
+
+import pytest
+
+from scrcpy import Client
+from scrcpy.fleet import DeviceFleet
+from scrcpy.reconnect import ReconnectPolicy
+from scrcpy.watchdog import StallWatchdog
+from tests.utils import HANDSHAKE, FakeADBDevice, SocketADBDevice, wait_for
+
+
+def test_check():
+    watchdog = StallWatchdog(byte_timeout=2, frame_timeout=5)
+    stats = types.SimpleNamespace(connected_at=None, last_byte_at=None, last_frame_at=None, as_dict=dict)
+    assert watchdog.check(stats, now=100) is None
+
+    stats.connected_at = 100
+    assert watchdog.check(stats, now=101) is None
+    assert watchdog.check(stats, now=102).reason == "bytes"
+
+    stats.last_byte_at = 104
+    stall = watchdog.check(stats, now=105)
+    assert stall.reason == "frames"
+    assert stall.byte_idle == 1
+    assert stall.frame_idle == 5
+
+    # Progress made before a reconnection does not count
+    stats.connected_at = 110
+    assert watchdog.check(stats, now=111) is None
+    assert StallWatchdog(byte_timeout=None, frame_timeout=None).check(stats, now=1000) is None
+
+
+def test_stall_event():
+    def on_stall(stall):
+        stalls.append(stall)
+        client.stop()
+
+    stalls = []
+    client = Client(
+        device=FakeADBDevice([list(HANDSHAKE), []]),
+        watchdog=StallWatchdog(byte_timeout=0.05),
+    )
+    client.add_listener("stall", on_stall)
+    client.start()
+    assert len(stalls) == 1
+    assert stalls[0].reason == "bytes"
+    assert stalls[0].stats["bytes_received"] == 0
+
+    disconnected = []
+    client = Client(
+        device=FakeADBDevice([list(HANDSHAKE), []]),
+        watchdog=StallWatchdog(byte_timeout=0.05, restart=True),
+    )
+    client.add_listener("disconnect", lambda: disconnected.append(1))
+    with pytest.raises(ConnectionError) as e:
+        client.start()
+    assert "stalled" in str(e.value)
+    assert disconnected == [1]
+
+
+def test_fleet_stall():
+    fleet = DeviceFleet(workers=1)
+    fleet.start(daemon_threaded=True)
+    stalls = []
+    client = Client(device=SocketADBDevice("stall"), watchdog=StallWatchdog(byte_timeout=0.05, restart=True))
+    client.add_listener("stall", stalls.append)
+    fleet.add(client)
+    wait_for(lambda: not client.alive)
+    assert len(stalls) == 1
+    assert "stalled" in fleet.status()["stall"]["error"]
+    fleet.stop()
+
+
+def test_fleet_stall_reconnect():
+    fleet = DeviceFleet(workers=1)
+    fleet.start(daemon_threaded=True)
+    device = SocketADBDevice("stall")
+    client = Client(
+        device=device,
+        watchdog=StallWatchdog(byte_timeout=0.05, restart=True),
+        reconnect=ReconnectPolicy(initial_delay=0.001),
+    )
+    reconnects = []
+    client.add_listener("reconnect", reconnects.append)
+    fleet.add(client)
+    wait_for(lambda: reconnects)
+    assert client.alive
+    assert "stalled" in fleet.status()["stall"]["error"]
+    fleet.stop()
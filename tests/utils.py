@@ -1,3 +1,30 @@
+import pathlib
+import pickle
+import socket
+import time
+
+import pytest
+from adbutils import AdbError
+from adbutils._proto import FileInfo
+
+VIDEO_DATA_PATH = (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve()
+# Dummy byte, device name and resolution sent by the server on the video socket
+HANDSHAKE = [b"\x00", b"test", b"\x07\x80\x04\x38"]
+
+
+def load_video_data():
+    """
+    Chunks of the recorded H.264 test stream, a new list on every call
+    """
+    with VIDEO_DATA_PATH.open("rb") as f:
+        return pickle.load(f)
+
+
+@pytest.fixture
+def video_data():
+    return load_video_data()
+
+
 class FakeStream:
     def __init__(self, data=None):
         if data is None:
@@ -32,3 +59,80 @@ class FakeStream:
 
     def send(self, x):
         pass
+
+    def sendall(self, x):
+        pass
+
+
+class Sync:
+    @staticmethod
+    def push(a, b):
+        pass
+
+    @staticmethod
+    def stat(path):
+        return FileInfo(0, 0, None, path)
+
+
+class FakeADBDevice:
+    """
+    Device whose connections are FakeStreams fed from data, one list of chunks per connection
+
+    Shell commands, socket names, connections and data sent are recorded per instance.
+    """
+
+    sync = Sync()
+
+    def __init__(self, data, wait=0):
+        self.data = data
+        self.commands = []
+        self.names = []
+        self.streams = []
+        self.sent = []
+        self.__wait = wait
+
+    def shell(self, a, stream=True):
+        self.commands.append(a)
+        return FakeStream([b"\x00" * 128])
+
+    def create_connection(self, a, b):
+        if self.__wait > 0:
+            self.__wait -= 1
+            raise AdbError()
+
+        self.names.append(b)
+        stream = FakeStream(self.data.pop(0))
+        stream.send = stream.sendall = self.sent.append
+        self.streams.append(stream)
+        return stream
+
+
+class SocketADBDevice:
+    """
+    Device whose connections are real socket pairs, the server side is kept in self.peers
+    """
+
+    sync = Sync()
+
+    def __init__(self, serial):
+        self.serial = serial
+        self.peers = []
+
+    @staticmethod
+    def shell(a, stream=True):
+        return FakeStream([b"\x00" * 128])
+
+    def create_connection(self, a, b):
+        client_side, server_side = socket.socketpair()
+        # Video socket first, then control socket, for every server
+        if len(self.peers) % 2 == 0:
+            server_side.sendall(b"\x00" + b"test".ljust(64, b"\x00") + b"\x07\x80\x04\x38")
+        self.peers.append(server_side)
+        return client_side
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)